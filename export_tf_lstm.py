@@ -0,0 +1,27 @@
+"""
+export_tf_lstm.py: Run this script after having trained the LSTM with
+'LSTM_kaggle_score_0.85620.py' to export the last checkpoint as a float32,
+inference-only SavedModel. 'make_submission_tf.py' uses the SavedModel
+when it exists, instead of rebuilding the graph from the checkpoint.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+from tf_lstm import *
+
+
+# True if the LSTM was trained with use_sequence_length ('LSTM_kaggle_score_0.85620.py'):
+# the SavedModel then takes also the lengths of the tweets
+use_sequence_length = False
+
+wordVectors = load_embeddings('data/our_trained_wordvectors/wordvecs_sg_6.npy')
+print('Loaded the word vectors!')
+
+export_saved_model(wordVectors, checkpoint_dir='data/models', export_dir='data/models/lstm_saved_model',
+                   use_sequence_length=use_sequence_length)
+print('Exported the SavedModel to data/models/lstm_saved_model')
@@ -13,21 +13,40 @@ __version_    = "1.0.1"
 __status__    = "Project"
 
 import pandas as pd
+import array
+import collections
 import datetime
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
 import numpy as np
-import re
+import queue
+import shutil
+import threading
 import keras
+from keras import backend as K
 from keras.models import Model, Input, model_from_json
-from keras.layers import Conv1D, MaxPooling1D
+from keras.layers import Conv1D, MaxPooling1D, ZeroPadding1D, Lambda
 
 
 # UTILITIES FOR SPLITTING THE DATA
 
-def split_data(x, ratio, seed=1):
-    """split the dataset based on the split ratio."""
+def split_data(x, ratio, seed=1, labels=None, lazy=False):
+    """
+    split the dataset based on the split ratio.
+    If lazy is True, x_tr and x_te are RowViews of x instead of copies
+    (useful when x is a memory-mapped ids matrix, see load_ids_dataset).
+    labels (e.g. from the header of the ids matrix) replace the default
+    ones: first half of the rows positive, second half negative.
+    """
 
-    y = np.array([1] * int(x.shape[0]/2))
-    y = np.append(y, np.array([0] * int(x.shape[0]/2)))
+    if labels is not None:
+        y = np.asarray(labels)
+    else:
+        y = np.array([1] * int(x.shape[0]/2))
+        y = np.append(y, np.array([0] * int(x.shape[0]/2)))
     # set seed
     np.random.seed(seed)
     # generate random indices
@@ -37,18 +56,29 @@ def split_data(x, ratio, seed=1):
     index_tr = indices[: index_split]
     index_te = indices[index_split:]
     # create split
-    x_tr = x[index_tr]
-    x_te = x[index_te]
+    if lazy:
+        x_tr = RowView(x, index_tr)
+        x_te = RowView(x, index_te)
+    else:
+        x_tr = x[index_tr]
+        x_te = x[index_te]
     y_tr = y[index_tr]
     y_te = y[index_te]
     return x_tr, x_te, y_tr, y_te
 
 
-def split_data_tf(x, ratio, seed=1):
-    """split the dataset based on the split ratio."""
+def split_data_tf(x, ratio, seed=1, labels=None, lazy=False):
+    """
+    split the dataset based on the split ratio, with one-hot labels
+    ([1, 0] positive, [0, 1] negative). lazy and labels as in split_data.
+    """
 
-    y = np.array([[1, 0]] * int(x.shape[0]/2))
-    y = np.concatenate((y, np.array([[0, 1]] * int(x.shape[0]/2))))
+    if labels is not None:
+        labels = np.asarray(labels)
+        y = np.stack((labels == 1, labels != 1), axis=1).astype(int)
+    else:
+        y = np.array([[1, 0]] * int(x.shape[0]/2))
+        y = np.concatenate((y, np.array([[0, 1]] * int(x.shape[0]/2))))
     # set seed
     np.random.seed(seed)
     # generate random indices
@@ -58,8 +88,12 @@ def split_data_tf(x, ratio, seed=1):
     index_tr = indices[: index_split]
     index_te = indices[index_split:]
     # create split
-    x_tr = x[index_tr]
-    x_te = x[index_te]
+    if lazy:
+        x_tr = RowView(x, index_tr)
+        x_te = RowView(x, index_te)
+    else:
+        x_tr = x[index_tr]
+        x_te = x[index_te]
     y_tr = y[index_tr]
     y_te = y[index_te]
     return x_tr, x_te, y_tr, y_te
@@ -67,61 +101,240 @@ def split_data_tf(x, ratio, seed=1):
 
 # METHODS FOR THE PRE-PROCESSING OF OUR DATA
 
-def clean_sentences(string):
-    # Lower cases whole sentence, and then replaces the following
+class _StripSpecialChars(dict):
+    """
+    translation table for str.translate that keeps lower case letters,
+    digits and spaces and deletes every other character
+    """
+
+    def __init__(self):
+        kept_chars = "abcdefghijklmnopqrstuvwxyz0123456789 "
+        super(_StripSpecialChars, self).__init__((ord(c), ord(c)) for c in kept_chars)
+
+    def __missing__(self, key):
+        return None
+
+
+class Tokenizer(object):
+    """
+    precompiled version of the cleaning done by clean_sentences, that
+    produces exactly the same tokens. Compared to the old version, the
+    sentence is lower cased only once, the special characters are stripped
+    with a prebuilt translation table instead of compiling a regex on every
+    call and the "wo", "ca", "sha" replacements are done once on the whole
+    sentence instead of on every token with three list comprehensions.
+    """
+
+    # replacements applied, in this order, to the lower cased sentence.
+    # The order matters (e.g. removing "<user>" can create a "<url>"),
+    # so they are kept as C-level str.replace passes rather than a single
+    # regex alternation, which needs a python callback for every match
+    replacements = (("<br />", " "),
+                    ("n't", " not"),
+                    ("'m", " am"),
+                    ("'ll", " will"),
+                    ("'d", " would"),
+                    ("'ve", " have"),
+                    ("'re", " are"),
+                    ("'s", " is"),
+                    ("#", "<hashhtagg> "),
+                    ("lol", "laugh"),
+                    ("<3", "love"),
+                    ("<user>", ""),
+                    ("<url>", ""))
+
+    # replacements applied to every token after the split. They never
+    # involve spaces, so they can be done on the whole sentence
+    token_replacements = (("wo", "will"), ("ca", "can"), ("sha", "shall"))
+
+    def __init__(self):
+        self._strip_table = _StripSpecialChars()
 
-    string = string.lower().replace("<br />", " ")
-    string = string.replace("n't", " not")
-    string = string.replace("'m", " am")
-    string = string.replace("'ll", " will")
-    string = string.replace("'d", " would")
-    string = string.replace("'ve", " have")
-    string = string.replace("'re", " are")
-    string = string.replace("'s", " is")
-    string = string.replace("#", "<hashhtagg> ")
-    string = string.replace("lol", "laugh")
-    string = string.replace("<3", "love")
-    string = string.replace("<user>", "")
-    string = string.replace("<url>", "")
+    def tokenize(self, string):
+        """cleans and tokenizes a single sentence"""
+        string = string.lower()
+        for old, new in self.replacements:
+            string = string.replace(old, new)
 
-    strip_special_chars = re.compile("[^A-Za-z0-9 ]+")
-    string = re.sub(strip_special_chars, "", string.lower())
+        string = string.translate(self._strip_table)
 
-    # Tokenizes string:
-    string = string.split()
+        for old, new in self.token_replacements:
+            string = string.replace(old, new)
 
-    string = [w.replace("wo", "will") for w in string]
-    string = [w.replace("ca", "can") for w in string]
-    string = [w.replace("sha", "shall") for w in string]
+        return string.split()
 
-    return string
+    def tokenize_batch(self, lines):
+        """cleans and tokenizes a list of sentences, returning a list of token lists"""
+        tokenize = self.tokenize
+        return [tokenize(line) for line in lines]
 
 
-def create_word_list(documents, filter):
+_tokenizer = Tokenizer()
+
+
+def clean_sentences(string):
+    # Lower cases whole sentence, replaces contractions, hashtags, smileys, users and urls,
+    # strips the special characters and tokenizes the sentence (see Tokenizer)
+    return _tokenizer.tokenize(string)
+
+
+def _count_words_worker(lines):
+    """counts the words of the cleaned lines of one shard"""
+    counts = collections.Counter()
+    for line in lines:
+        counts.update(clean_sentences(line))
+    return counts
+
+
+def count_words(documents, num_workers=None, shard_size=20000):
+    """
+    counts the words of the cleaned documents with a pool of processes.
+    The documents are read lazily in shards (documents can be a list or any
+    iterable, e.g. iter_lines over the corpus files) and the Counter of every
+    shard is merged in the main process as soon as it is ready, so the
+    corpus is never in memory. The sum does not depend on the order of the shards.
+    On Windows the calling script must be protected by
+    if __name__ == '__main__', as the workers re-import it.
+
+    :return: a Counter with the number of occurrences of every word
     """
-    Create word list of unique words which occurrences are higher than filter
+    counts = collections.Counter()
+    done = 0
+    pool = multiprocessing.Pool(num_workers)
+    try:
+        shards = (shard for _, shard in _iter_shards(documents, shard_size))
+        for shard_counts in pool.imap_unordered(_count_words_worker, shards):
+            counts.update(shard_counts)
+            done += 1
+            if done % 50 == 0:
+                print('Shards counted: ', done)
+    finally:
+        pool.close()
+        pool.join()
+    return counts
+
+
+def sorted_vocabulary(counts, filter):
     """
+    words whose occurrences are at least filter, from the most frequent one.
+    Words with the same number of occurrences are in alphabetical order,
+    so the vocabulary (and the ids) is the same at every run
+    """
+    words = [word for word, count in counts.items() if count >= filter]
+    return sorted(words, key=lambda word: (-counts[word], word))
+
 
-    word_dict = {}
-    i = 0
-    for document in documents:
-        if i % 10000 == 0:
-            print('Step to the end: ', len(documents) - i)
-        split = clean_sentences(document)
-        for word in split:
-            if word not in word_dict:
-                word_dict[word] = 1
+def create_word_list(documents, filter, num_workers=None, path='words_list_tweets_final.npy'):
+    """
+    Create word list of unique words which occurrences are higher than filter.
+    The words are counted streaming the documents in parallel (see count_words)
+    and sorted by frequency (see sorted_vocabulary), then saved as byte strings
+    """
+
+    counts = count_words(documents, num_workers)
+    word_list = [str.encode(word) for word in sorted_vocabulary(counts, filter)]
+
+    np.save(path, word_list)
+    return word_list
+
+
+class MySentences(object):
+    """
+    Iterator object that iterates through files in directory, picking every sentence from the file.
+    This is why "combined_full.txt" should be placed in its own directory.
+    If cache_dir is given, the files are tokenized only once and every following
+    iteration (e.g. every epoch of word2vec) replays their TokenCache.
+    """
+    def __init__(self, dirname, cache_dir=None):
+        self.dirname = dirname
+        self.cache_dir = cache_dir
+        self.caches = {}
+
+    def __iter__(self):
+        for fname in os.listdir(self.dirname):
+            path = os.path.join(self.dirname, fname)
+            if self.cache_dir is not None:
+                if path not in self.caches:
+                    self.caches[path] = TokenCache.for_file(path, self.cache_dir)
+                for sentence in self.caches[path]:
+                    yield sentence
             else:
-                word_dict[word] += 1
-        i += 1
+                for line in open(path, 'r', encoding="utf-8", errors="replace"):
+                    yield clean_sentences(line)
 
-    word_set = set()
-    for key, value in word_dict.items():
-        if value >= filter:
-            word_set.add(str.encode(key))
 
-    np.save('words_list_tweets_final.npy', list(word_set))
-    return list(word_set)
+class Vocabulary(object):
+    """
+    hash-indexed word list: maps every word to its row in the
+    word vectors matrix in O(1) instead of scanning the list with
+    list.index. Unknown words are mapped to the row of the 'UNK'
+    vector appended in skipgram_gensim.py (the last row, unless the
+    vocabulary was extended by skipgram_incremental.py)
+    """
+
+    def __init__(self, words):
+        self.words = [w.decode('utf-8') if isinstance(w, bytes) else str(w) for w in words]
+
+        # iterating backwards so that duplicated words keep their first index, as list.index does
+        self.word_to_id = {word: idx for idx, word in reversed(list(enumerate(self.words)))}
+        self.unk_id = self.word_to_id.get('UNK', len(self.words) - 1)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.word_to_id
+
+    def get_id(self, word):
+        """returns the id of the word, or the id of 'UNK' if the word is unknown"""
+        return self.word_to_id.get(word, self.unk_id)
+
+    def sentence_to_ids(self, words, max_seq_length):
+        """converts the first max_seq_length words of a cleaned sentence to their ids"""
+        word_to_id = self.word_to_id
+        unk_id = self.unk_id
+        return [word_to_id.get(word, unk_id) for word in words[:max_seq_length]]
+
+    def extend(self, words):
+        """
+        appends the new words after the existing ones (also after 'UNK'),
+        so that the ids of the words already in the vocabulary do not change.
+        Returns the list of the words that were added
+        """
+        added = []
+        for word in words:
+            word = word.decode('utf-8') if isinstance(word, bytes) else str(word)
+            if word not in self.word_to_id:
+                self.word_to_id[word] = len(self.words)
+                self.words.append(word)
+                added.append(word)
+        return added
+
+    def save(self, path):
+        """
+        saves the vocabulary as a utf-8 text file with one word per line,
+        which is smaller than the .npy word list and much faster to load
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.words))
+
+    @classmethod
+    def load(cls, path):
+        """loads a vocabulary saved with Vocabulary.save"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(f.read().split('\n'))
+
+    @classmethod
+    def from_npy(cls, path):
+        """builds the vocabulary from a word list saved with np.save (e.g. word_list_sg_6.npy)"""
+        return cls(np.load(path).tolist())
+
+
+def _as_vocabulary(words_list):
+    """accepts both a Vocabulary and a plain word list"""
+    if isinstance(words_list, Vocabulary):
+        return words_list
+    return Vocabulary(words_list)
 
 
 def create_ids_matrix(positive_files, negative_files, max_seq_length, wordsList):
@@ -129,119 +342,1434 @@ def create_ids_matrix(positive_files, negative_files, max_seq_length, wordsList)
     Convert to an ids matrix
     """
 
+    vocabulary = _as_vocabulary(wordsList)
+
     total_files_length = len(positive_files) + len(negative_files)
     ids = np.zeros((total_files_length, max_seq_length), dtype='int32')
     file_counter = 0
     start_time = datetime.datetime.now()
 
-    for line in positive_files:
-        index_counter = 0
-        split = clean_sentences(line)  # Cleaning the sentence
+    # positive tweets first, then negative ones
+    for files in (positive_files, negative_files):
+        for line in files:
+            split = clean_sentences(line)  # Cleaning the sentence
+            row = vocabulary.sentence_to_ids(split, max_seq_length)
+            ids[file_counter, :len(row)] = row
+
+            if file_counter % 10000 == 0:
+                print("Steps to end: " + str(total_files_length - file_counter))
+                print('Time of execution: ', datetime.datetime.now() - start_time)
+
+            file_counter = file_counter + 1
 
-        for word in split:
-            try:
-                ids[file_counter][index_counter] = wordsList.index(word)
-            except ValueError:
-                ids[file_counter][index_counter] = len(
-                    wordsList) - 1  # Vector for unknown positive vectors, not used otherwise
-            index_counter = index_counter + 1
+    np.save('ids_sg_6.npy', ids)
+    return ids
+
+
+def create_test_ids_matrix(test_files, max_seq_length, wordsList, path='ids_test_sg_6.npy'):
+    """
+    Convert the test tweets to an ids matrix. Every line
+    of the test file starts with "id," that is stripped
+    before cleaning the sentence
+    """
 
-            # If we have already seen maxSeqLength words, we break the loop of the words of a tweet
-            if index_counter >= max_seq_length:
-                break
+    vocabulary = _as_vocabulary(wordsList)
 
-        if file_counter % 10000 == 0:
+    total_files_length = len(test_files)
+    ids = np.zeros((total_files_length, max_seq_length), dtype='int32')
+    start_time = datetime.datetime.now()
+
+    for file_counter, line in enumerate(test_files):
+        comma_index = line.index(',')
+        split = clean_sentences(line[comma_index+1:])
+        row = vocabulary.sentence_to_ids(split, max_seq_length)
+        ids[file_counter, :len(row)] = row
+
+        if file_counter % 1000 == 0:
             print("Steps to end: " + str(total_files_length - file_counter))
             print('Time of execution: ', datetime.datetime.now() - start_time)
 
-        file_counter = file_counter + 1
+    np.save(path, ids)
+    return ids
 
-    del positive_files
 
-    for line in negative_files:
-        index_counter = 0
-        split = clean_sentences(line)
+def _fill_ids_rows(ids, lines, vocabulary, max_seq_length, strip_id=False):
+    """
+    writes in the rows of ids (already filled with zeros) the ids of the
+    cleaned lines. If strip_id is True, the "id," prefix of the test lines
+    is removed before cleaning the sentence.
+    Returns the number of tokens written in every row
+    """
+    lengths = np.zeros(len(lines), dtype='int32')
+    for row_index, line in enumerate(lines):
+        if strip_id:
+            line = line[line.index(',')+1:]
+        row = vocabulary.sentence_to_ids(clean_sentences(line), max_seq_length)
+        ids[row_index, :len(row)] = row
+        lengths[row_index] = len(row)
+    return lengths
 
-        for word in split:
-            try:
-                ids[file_counter][index_counter] = wordsList.index(word)
-            except ValueError:
-                ids[file_counter][index_counter] = len(
-                    wordsList) - 1  # Vector for unknown negative vectors, not used otherwise
-            index_counter = index_counter + 1
 
-            if index_counter >= max_seq_length:
-                break
+# vocabulary of the worker processes of create_ids_matrix_parallel,
+# sent once to every worker by the pool initializer
+_worker_vocabulary = None
 
-        if file_counter % 10000 == 0:
-            print("Steps to end: " + str(total_files_length - file_counter))
+
+def _init_ids_worker(vocabulary):
+    global _worker_vocabulary
+    _worker_vocabulary = vocabulary
+
+
+def _ids_worker(shard):
+    """fills the slice of the memory-mapped ids matrix of one shard of lines"""
+    output_path, start, lines, max_seq_length, strip_id = shard
+
+    ids = np.load(output_path, mmap_mode='r+')
+    lengths = _fill_ids_rows(ids[start:start+len(lines)], lines, _worker_vocabulary, max_seq_length, strip_id)
+    ids.flush()
+    del ids
+    return start, lengths
+
+
+def _iter_shards(lines, shard_size):
+    """groups any iterable of lines in (start, list of lines) shards"""
+    lines = iter(lines)
+    start = 0
+    while True:
+        shard = list(itertools.islice(lines, shard_size))
+        if not shard:
+            return
+        yield start, shard
+        start += len(shard)
+
+
+def create_ids_matrix_parallel(lines, max_seq_length, wordsList, output_path, num_workers=None,
+                               shard_size=20000, strip_id=False, num_lines=None, labels=None):
+    """
+    Convert to an ids matrix using a pool of processes. The lines are split
+    in shards and every worker writes the ids of its shard directly in its
+    own slice of the .npy file (output_path), opened as a memory map, so
+    only the lines are sent to the workers and no result array is pickled.
+    The matrix is identical to the one of create_ids_matrix for any number
+    of workers. The number of tokens of every row (and the labels, if given)
+    are saved in the header file next to the ids matrix (see save_ids_header).
+    On Windows the calling script must be protected by
+    if __name__ == '__main__', as the workers re-import it.
+
+    :param lines: list of tweets (e.g. positive_files + negative_files), or any
+                  iterable of tweets (e.g. iter_lines) if num_lines is given
+    :param max_seq_length: number of columns of the ids matrix
+    :param wordsList: Vocabulary or word list
+    :param output_path: path of the .npy file that will contain the ids matrix
+    :param num_workers: number of processes, by default the number of cores
+    :param shard_size: number of lines sent to a worker at a time
+    :param strip_id: True for the test file, where every line starts with "id,"
+    :param num_lines: number of lines, needed only if lines has no len()
+    :param labels: optional labels of the tweets, saved in the header file
+    :return: the ids matrix, memory-mapped in read mode
+    """
+
+    vocabulary = _as_vocabulary(wordsList)
+    total_files_length = len(lines) if num_lines is None else num_lines
+
+    # the file is created filled with zeros, the padding value
+    ids = np.lib.format.open_memmap(output_path, mode='w+', dtype='int32',
+                                    shape=(total_files_length, max_seq_length))
+    del ids
+
+    # the shards are read lazily from lines, while the workers consume them
+    shards = ((output_path, start, shard, max_seq_length, strip_id)
+              for start, shard in _iter_shards(lines, shard_size))
+
+    lengths = np.zeros(total_files_length, dtype='int32')
+    start_time = datetime.datetime.now()
+    done = 0
+    pool = multiprocessing.Pool(num_workers, initializer=_init_ids_worker, initargs=(vocabulary,))
+    try:
+        for start, shard_lengths in pool.imap_unordered(_ids_worker, shards):
+            lengths[start:start+len(shard_lengths)] = shard_lengths
+            done += len(shard_lengths)
+            print("Steps to end: " + str(total_files_length - done))
             print('Time of execution: ', datetime.datetime.now() - start_time)
-        file_counter = file_counter + 1
+    finally:
+        pool.close()
+        pool.join()
 
-    np.save('ids_sg_6.npy', ids)
+    if done != total_files_length:
+        raise ValueError('Expected %d lines, found %d' % (total_files_length, done))
+
+    save_ids_header(output_path, lengths, labels)
+    return np.load(output_path, mmap_mode='r')
+
+
+# METHODS FOR STREAMING THE DATA FROM DISK
+
+def iter_lines(paths):
+    """lazily yields the lines of the files, one file after the other"""
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                yield line
+
+
+def count_lines(path):
+    """counts the lines of a file without keeping them in memory"""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return sum(1 for _ in f)
+
+
+def iter_ids_chunks(lines, wordsList, max_seq_length, chunk_size=10000, strip_id=False):
+    """
+    converts raw tweets (a list or any iterable, e.g. iter_lines) to ids
+    matrices of at most chunk_size rows, one chunk at a time and only in
+    memory: the rows are the same of create_ids_matrix_parallel.
+    If strip_id is True, the "id," prefix of the test lines is removed.
+    """
+    vocabulary = _as_vocabulary(wordsList)
+    for _, shard in _iter_shards(lines, chunk_size):
+        ids = np.zeros((len(shard), max_seq_length), dtype='int32')
+        _fill_ids_rows(ids, shard, vocabulary, max_seq_length, strip_id)
+        yield ids
+
+
+def prefetch(iterable, max_items=4):
+    """
+    iterates over iterable in a background thread, keeping at most max_items
+    items ready in a queue, so that the producer (e.g. the cleaning of the
+    tweets) runs while the consumer (e.g. the prediction of the model, that
+    releases the GIL) works on the previous items. The exceptions of the
+    producer are raised in the consumer.
+    """
+    items = queue.Queue(max_items)
+    end = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put((item, None))
+        except Exception as e:
+            items.put((None, e))
+            return
+        items.put((end, None))
+
+    producer = threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+
+    while True:
+        item, error = items.get()
+        if error is not None:
+            raise error
+        if item is end:
+            return
+        yield item
+
+
+def ids_header_path(ids_path):
+    """path of the header file saved next to an ids matrix"""
+    return os.path.splitext(ids_path)[0] + '_header.npz'
+
+
+def save_ids_header(ids_path, lengths, labels=None):
+    """
+    saves next to the ids matrix a small header with the number of tokens
+    of every row (the padding zeros are also the id of a real word, so they
+    cannot be recognized in the matrix) and, if given, the labels of the rows
+    """
+    header = {'lengths': np.asarray(lengths, dtype='int32')}
+    if labels is not None:
+        header['labels'] = np.asarray(labels, dtype='int8')
+    np.savez(ids_header_path(ids_path), **header)
+
+
+def create_ids_dataset(positive_path, negative_path, max_seq_length, wordsList, output_path, num_workers=None,
+                       cache_dir=None):
+    """
+    creates the ids matrix of the train set streaming the tweets from the
+    positive and the negative files, without loading them in memory.
+    The header file contains the labels (1 for the positive tweets,
+    then 0 for the negative ones) and the lengths of the rows.
+    If cache_dir is given, the tokens of the files are read from their
+    TokenCache (see create_ids_matrix_cached) instead of cleaning the tweets.
+    """
+    if cache_dir is not None:
+        # the caches are opened once (the files are hashed once) for the labels and the ids
+        caches = [TokenCache.for_file(path, cache_dir) for path in (positive_path, negative_path)]
+        num_positive, num_negative = len(caches[0]), len(caches[1])
+    else:
+        num_positive = count_lines(positive_path)
+        num_negative = count_lines(negative_path)
+    labels = np.concatenate((np.ones(num_positive, dtype='int8'), np.zeros(num_negative, dtype='int8')))
+
+    if cache_dir is not None:
+        return create_ids_matrix_cached([positive_path, negative_path], max_seq_length, wordsList, output_path,
+                                        cache_dir, labels=labels, caches=caches)
+
+    return create_ids_matrix_parallel(iter_lines([positive_path, negative_path]), max_seq_length, wordsList,
+                                      output_path, num_workers=num_workers,
+                                      num_lines=num_positive + num_negative, labels=labels)
+
+
+def load_ids_dataset(ids_path):
+    """
+    opens lazily an ids matrix (memory-mapped, so that only the rows that
+    are used are read from disk) with the labels and lengths of its header.
+    labels and lengths are None if the ids matrix has no header file.
+
+    :return: ids, labels, lengths
+    """
+    ids = np.load(ids_path, mmap_mode='r')
+
+    labels = None
+    lengths = None
+    if os.path.exists(ids_header_path(ids_path)):
+        header = np.load(ids_header_path(ids_path))
+        lengths = header['lengths']
+        if 'labels' in header.files:
+            labels = header['labels']
+
+    return ids, labels, lengths
+
+
+def _append_npy_rows(path, rows):
+    """
+    appends rows at the end of a .npy file in place: only the shape in the
+    header of the file is rewritten and the existing rows are not read.
+    Returns False if the padding of the header has no room for the new shape
+    """
+    rows = np.ascontiguousarray(rows)
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        data_offset = f.tell()
+
+        if fortran_order or dtype != rows.dtype or tuple(shape[1:]) != rows.shape[1:]:
+            raise ValueError('Cannot append rows of shape %s and type %s to %s'
+                             % (rows.shape, rows.dtype, path))
+
+        # magic string, version and length of the header
+        prefix_length = 10 if version == (1, 0) else 12
+        header_length = data_offset - prefix_length
+        new_shape = (shape[0] + len(rows),) + tuple(shape[1:])
+        header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+            np.lib.format.dtype_to_descr(dtype), new_shape)
+        if len(header) + 1 > header_length:
+            return False
+
+        f.seek(data_offset + int(np.prod(shape)) * dtype.itemsize)
+        f.write(rows.tobytes())
+        f.seek(prefix_length)
+        f.write((header.ljust(header_length - 1) + '\n').encode('latin1'))
+    return True
+
+
+def append_ids_rows(ids_path, rows, lengths, labels=None):
+    """
+    appends new rows (with their lengths and labels) to an ids matrix and to
+    its header file. The rows already in the matrix are not changed, so the
+    ids of the old tweets and the models trained on them stay valid.
+    """
+    header = np.load(ids_header_path(ids_path)) if os.path.exists(ids_header_path(ids_path)) else None
+    if header is None:
+        raise ValueError('%s has no header file, create it with create_ids_dataset' % ids_path)
+    if ('labels' in header.files) != (labels is not None):
+        raise ValueError('The labels must be given only if the header of %s has labels' % ids_path)
+
+    all_lengths = np.concatenate((header['lengths'], np.asarray(lengths, dtype='int32')))
+    all_labels = None
+    if labels is not None:
+        all_labels = np.concatenate((header['labels'], np.asarray(labels, dtype='int8')))
+    header.close()
+
+    if not _append_npy_rows(ids_path, rows):
+        # no room for the new shape in the header of the file: the matrix is copied once
+        ids = np.load(ids_path, mmap_mode='r')
+        new_path = os.path.splitext(ids_path)[0] + '_tmp.npy'
+        new_ids = np.lib.format.open_memmap(new_path, mode='w+', dtype=ids.dtype,
+                                            shape=(len(ids) + len(rows),) + ids.shape[1:])
+        for start in range(0, len(ids), 1000000):
+            end = min(start + 1000000, len(ids))
+            new_ids[start:end] = ids[start:end]
+        new_ids[len(ids):] = rows
+        new_ids.flush()
+        del ids, new_ids
+        os.remove(ids_path)
+        os.rename(new_path, ids_path)
+
+    save_ids_header(ids_path, all_lengths, all_labels)
+
+
+def append_ids_dataset(ids_path, positive_path, negative_path, wordsList, num_workers=None):
+    """
+    incremental version of create_ids_dataset: converts only the new positive
+    and negative tweets (e.g. of the last day) and appends their rows, with
+    their labels and lengths, to the ids matrix of the train set.
+    The rows are not sorted by label anymore, so the labels of the header
+    must be used to split the data (see load_ids_dataset).
+
+    :return: the number of rows appended
+    """
+    max_seq_length = np.load(ids_path, mmap_mode='r').shape[1]
+    new_path = os.path.splitext(ids_path)[0] + '_new.npy'
+
+    create_ids_dataset(positive_path, negative_path, max_seq_length, wordsList, new_path, num_workers)
+    new_ids, new_labels, new_lengths = load_ids_dataset(new_path)
+    append_ids_rows(ids_path, np.asarray(new_ids), new_lengths, new_labels)
+
+    del new_ids
+    os.remove(new_path)
+    os.remove(ids_header_path(new_path))
+    return len(new_labels)
+
+
+class RowView(object):
+    """
+    rows of an array (e.g. a memory-mapped ids matrix) selected by an
+    array of indices. The rows are read only when they are accessed, so
+    splitting a memory-mapped matrix does not copy it in memory.
+    Slicing a view (e.g. a batch) returns a numpy array.
+    """
+
+    def __init__(self, array, indices):
+        self.array = array
+        self.indices = np.asarray(indices)
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def shape(self):
+        return (len(self.indices),) + self.array.shape[1:]
+
+    def __getitem__(self, key):
+        return np.asarray(self.array[self.indices[key]])
+
+    def __array__(self, dtype=None):
+        rows = np.asarray(self.array[self.indices])
+        if dtype is not None:
+            rows = rows.astype(dtype)
+        return rows
+
+
+def batch_generator(x, y, batch_size, shuffle=True, seed=1):
+    """
+    infinite generator of (x, y) batches, to be used with fit_generator
+    when x is a RowView of a memory-mapped ids matrix. The order of
+    the rows is shuffled at every epoch if shuffle is True
+    """
+    random_state = np.random.RandomState(seed)
+    positions = np.arange(len(x))
+    while True:
+        if shuffle:
+            random_state.shuffle(positions)
+        for start in range(0, len(positions), batch_size):
+            batch = positions[start:start+batch_size]
+            yield x[batch], y[batch]
+
+
+def bucket_batches(lengths, batch_size, shuffle=True, random_state=None, pool_batches=100):
+    """
+    groups the rows in batches of rows with similar number of tokens, so that
+    a batch can be cut to the length of its longest row: the rows are shuffled,
+    split in pools of pool_batches batches, sorted by length inside every pool
+    and cut in batches, and finally the order of the batches is shuffled.
+
+    :param lengths: number of tokens of every row (see load_ids_dataset)
+    :return: list of arrays with the indices of the rows of every batch
+    """
+    if random_state is None:
+        random_state = np.random.RandomState()
+
+    positions = np.arange(len(lengths))
+    if shuffle:
+        random_state.shuffle(positions)
+
+    batches = []
+    pool_size = batch_size * pool_batches
+    for start in range(0, len(positions), pool_size):
+        pool = positions[start:start+pool_size]
+        pool = pool[np.argsort(lengths[pool], kind='mergesort')]
+        batches.extend(pool[i:i+batch_size] for i in range(0, len(pool), batch_size))
+
+    if shuffle:
+        random_state.shuffle(batches)
+    return batches
+
+
+def bucket_batch_generator(x, y, lengths, batch_size, shuffle=True, seed=1, with_lengths=False):
+    """
+    infinite generator of batches of rows with similar length (see bucket_batches),
+    cut to the length of their longest row, so that the recurrent layers do not run
+    over the padding columns. It can be used with fit_generator by Keras models
+    that accept a variable number of time steps (input_length=None).
+    The rows without tokens keep one column, and their length is counted as 1.
+
+    :param x: ids matrix (also a RowView)
+    :param y: labels
+    :param lengths: number of tokens of every row of x
+    :param with_lengths: True to yield also the lengths of the rows (e.g. for the
+                         sequence_length of tf.nn.dynamic_rnn)
+    """
+    random_state = np.random.RandomState(seed)
+    lengths = np.maximum(np.asarray(lengths), 1)
+    while True:
+        for batch in bucket_batches(lengths, batch_size, shuffle, random_state):
+            batch_lengths = lengths[batch]
+            x_batch = x[batch][:, :batch_lengths.max()]
+            if with_lengths:
+                yield x_batch, y[batch], batch_lengths
+            else:
+                yield x_batch, y[batch]
+
+
+# METHODS FOR CACHING THE TOKENS OF THE CORPUS FILES
+
+def file_hash(path, block_size=2**20):
+    """sha1 of the content of a file, read in blocks"""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class TokenCache(object):
+    """
+    tokens of the cleaned lines of a corpus file, computed once with
+    clean_sentences and stored in a compact binary format: the ids of the
+    tokens of all the lines in one flat int32 array (tokens.npy), the
+    position of the first token of every line (offsets.npy) and the words
+    of the ids (words.txt). The cache is a directory named after the sha1
+    of the content of the file, so it is rebuilt only if the file changes.
+    The arrays are memory-mapped when the cache is read.
+
+    cache = TokenCache.for_file('data/combined_tweets/combined_full.txt', 'data/token_cache')
+    for sentence in cache: ...
+    """
+
+    # to be increased when clean_sentences changes, so that the old caches are not used
+    version = 1
+    # number of lines read at a time from the memory-mapped arrays
+    block_size = 10000
+
+    def __init__(self, cache_path):
+        self.tokens = np.load(os.path.join(cache_path, 'tokens.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(cache_path, 'offsets.npy'), mmap_mode='r')
+        with open(os.path.join(cache_path, 'words.txt'), 'r', encoding='utf-8') as f:
+            self.words = f.read().split('\n')
+
+    @classmethod
+    def for_file(cls, path, cache_dir, strip_id=False):
+        """
+        opens the cache of a file, building it if the file has no cache yet.
+        If strip_id is True (test file), the "id," prefix of the lines is not tokenized
+        """
+        key = '%s_v%d' % (file_hash(path), cls.version)
+        if strip_id:
+            key += '_strip_id'
+        cache_path = os.path.join(cache_dir, key)
+        if not os.path.exists(cache_path):
+            cls.build(path, cache_path, strip_id)
+        return cls(cache_path)
+
+    @staticmethod
+    def build(path, cache_path, strip_id=False):
+        """tokenizes every line of the file and saves the cache in the directory cache_path"""
+        word_to_id = {}
+        tokens = array.array('i')
+        offsets = array.array('q', [0])
+
+        with open(path, 'r', encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if strip_id:
+                    line = line[line.index(',')+1:]
+                # len(word_to_id) is evaluated before a new word is added, so it is its id
+                tokens.extend([word_to_id.setdefault(word, len(word_to_id)) for word in clean_sentences(line)])
+                offsets.append(len(tokens))
+
+        # the cache is written in a temporary directory, so an interrupted build is not used
+        # (one for every process, the same cache can be built by two processes at the same time)
+        tmp_path = '%s_tmp%d' % (cache_path, os.getpid())
+        if not os.path.exists(tmp_path):
+            os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, 'tokens.npy'), np.array(tokens, dtype='int32'))
+        np.save(os.path.join(tmp_path, 'offsets.npy'), np.array(offsets, dtype='int64'))
+        with open(os.path.join(tmp_path, 'words.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(sorted(word_to_id, key=word_to_id.get)))
+        try:
+            os.rename(tmp_path, cache_path)
+        except OSError:
+            # another process has built the cache in the meantime: its cache is used
+            if not os.path.exists(cache_path):
+                raise
+            shutil.rmtree(tmp_path)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        """yields the list of words of every line, as clean_sentences"""
+        words = self.words
+        for start in range(0, len(self), self.block_size):
+            offsets = np.asarray(self.offsets[start:start+self.block_size+1])
+            block_words = [words[token] for token in self.tokens[offsets[0]:offsets[-1]].tolist()]
+            offsets = (offsets - offsets[0]).tolist()
+            for i in range(len(offsets) - 1):
+                yield block_words[offsets[i]:offsets[i+1]]
+
+    def fill_ids(self, ids, wordsList, block_size=100000):
+        """
+        writes in the rows of ids (already filled with zeros, one row for every
+        line) the ids of the first words of every line, as _fill_ids_rows, but
+        without cleaning the lines: the ids of the cache are mapped to the ids
+        of the vocabulary with a single array lookup.
+        Returns the number of tokens written in every row
+        """
+        vocabulary = _as_vocabulary(wordsList)
+        cache_to_vocabulary = np.array([vocabulary.get_id(word) for word in self.words], dtype='int32')
+
+        lengths = np.minimum(np.diff(self.offsets), ids.shape[1]).astype('int32')
+        for start in range(0, len(self), block_size):
+            block_lengths = lengths[start:start+block_size]
+            # row and column of every token written in the block
+            rows = np.repeat(np.arange(len(block_lengths)), block_lengths)
+            columns = np.arange(len(rows)) - np.repeat(np.cumsum(block_lengths) - block_lengths, block_lengths)
+            positions = np.asarray(self.offsets[start:start+len(block_lengths)])[rows] + columns
+
+            block = np.zeros((len(block_lengths), ids.shape[1]), dtype='int32')
+            block[rows, columns] = cache_to_vocabulary[self.tokens[positions]]
+            ids[start:start+len(block_lengths)] = block
+        return lengths
+
+
+def line_chunks(path, chunk_size=2**22):
+    """
+    splits a file in (path, start, end) byte ranges of about chunk_size bytes.
+    Every range ends after a newline, so no line is split between two chunks
+    """
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        start = 0
+        while start < file_size:
+            f.seek(min(start + chunk_size, file_size))
+            f.readline()
+            end = min(f.tell(), file_size)
+            yield path, start, end
+            start = end
+
+
+def _tokenize_chunk(chunk):
+    """
+    cleans the lines of a byte range of a file and returns them as one string,
+    with the words of every line separated by spaces and the lines by newlines
+    (much faster to send back to the main process than lists of words)
+    """
+    path, start, end = chunk
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8', errors='replace')
+
+    # the same lines of a file opened in text mode (universal newlines)
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return '\n'.join(' '.join(clean_sentences(line)) for line in lines)
+
+
+class ParallelSentences(object):
+    """
+    same sentences as MySentences, in the same order, but the files are split
+    in byte ranges aligned to the lines (see line_chunks) that are decoded and
+    cleaned by a pool of processes, so that the trainer of gensim is not
+    waiting for a single thread reading the files.
+    On Windows the calling script must be protected by
+    if __name__ == '__main__', as the workers re-import it.
+    """
+    def __init__(self, dirname, num_workers=None, chunk_size=2**22):
+        self.dirname = dirname
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
+
+    def paths(self):
+        return [os.path.join(self.dirname, fname) for fname in os.listdir(self.dirname)]
+
+    def chunk_texts(self):
+        """yields the cleaned chunks of the files in order, as returned by _tokenize_chunk"""
+        chunks = (chunk for path in self.paths() for chunk in line_chunks(path, self.chunk_size))
+        pool = multiprocessing.Pool(self.num_workers)
+        try:
+            # imap keeps the order of the chunks
+            for text in pool.imap(_tokenize_chunk, chunks):
+                yield text
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def __iter__(self):
+        for text in self.chunk_texts():
+            for line in text.split('\n'):
+                yield line.split()
+
+
+def line_sentence_file(dirname, cache_dir, num_workers=None):
+    """
+    writes the cleaned sentences of the files in dirname in the format of
+    gensim's LineSentence (one sentence per line, words separated by spaces),
+    to be passed as corpus_file to Word2Vec (gensim >= 3.6), that then reads
+    it with all its workers. The file is in cache_dir, named after the hash of
+    the files, and it is written only if it does not exist yet.
+
+    :return: the path of the file
+    """
+    sentences = ParallelSentences(dirname, num_workers)
+    sha1 = hashlib.sha1()
+    for path in sentences.paths():
+        sha1.update(file_hash(path).encode())
+    path = os.path.join(cache_dir, 'sentences_%s_v%d.txt' % (sha1.hexdigest(), TokenCache.version))
+
+    if not os.path.exists(path):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            for text in sentences.chunk_texts():
+                f.write(text + '\n')
+        os.rename(path + '.tmp', path)
+    return path
+
+
+def create_ids_matrix_cached(paths, max_seq_length, wordsList, output_path, cache_dir,
+                             strip_id=False, labels=None, caches=None):
+    """
+    Convert to an ids matrix the lines of the files (one file after the other)
+    replaying their token caches instead of cleaning the lines again. The first
+    time a file is used its cache is built. The matrix and its header file are
+    the same as the ones of create_ids_matrix_parallel.
+    caches can be the TokenCache of the files, if they are already opened.
+
+    :return: the ids matrix, memory-mapped in read mode
+    """
+    vocabulary = _as_vocabulary(wordsList)
+    if caches is None:
+        caches = [TokenCache.for_file(path, cache_dir, strip_id) for path in paths]
+    total_files_length = sum(len(cache) for cache in caches)
+
+    # the file is created filled with zeros, the padding value
+    ids = np.lib.format.open_memmap(output_path, mode='w+', dtype='int32',
+                                    shape=(total_files_length, max_seq_length))
+    lengths = []
+    start = 0
+    for cache in caches:
+        lengths.append(cache.fill_ids(ids[start:start+len(cache)], vocabulary))
+        start += len(cache)
+    ids.flush()
+    del ids
+
+    save_ids_header(output_path, np.concatenate(lengths), labels)
+    return np.load(output_path, mmap_mode='r')
+
+
+# METHODS FOR STORING THE WORD VECTORS
+
+def unk_vector(vector_dim, seed=1):
+    """vector of the 'UNK' token, uniform in [-1, 1] and the same at every run"""
+    return np.random.RandomState(seed).uniform(-1, 1, vector_dim).astype('float32')
+
+
+def embeddings_path(path, dtype):
+    """path of the variant of a word vectors file stored in dtype, e.g. wordvecs_sg_6_float16.npy"""
+    return os.path.splitext(path)[0] + '_' + np.dtype(dtype).name + '.npy'
+
+
+def embeddings_scale_path(path):
+    """path of the scales of the rows of word vectors stored in int8"""
+    return os.path.splitext(path)[0] + '_scale.npy'
+
+
+def save_embeddings(path, word_vecs, dtype='float32'):
+    """
+    saves the word vectors in float32, float16 or int8. In int8 every row is
+    divided by its own scale (its largest absolute value / 127), saved in a
+    second file next to the vectors (see embeddings_scale_path)
+    """
+    if np.dtype(dtype) != np.int8:
+        np.save(path, np.asarray(word_vecs, dtype=dtype))
+        return
+
+    word_vecs = np.asarray(word_vecs, dtype='float32')
+    scale = np.abs(word_vecs).max(axis=1) / 127
+    scale[scale == 0] = 1
+    np.save(path, np.round(word_vecs / scale[:, None]).astype('int8'))
+    np.save(embeddings_scale_path(path), scale.astype('float32'))
+
+
+def load_embeddings(path, dtype='float32', mmap_mode='r', chunk_size=65536):
+    """
+    loads word vectors saved with save_embeddings (or np.save). The file is
+    memory-mapped: if the vectors are already stored in dtype they are
+    returned as they are, without reading them in memory (Keras and TensorFlow
+    copy them in their own variables anyway), otherwise they are converted
+    chunk by chunk (int8 vectors are multiplied by the scales of their rows).
+    """
+    word_vecs = np.load(path, mmap_mode=mmap_mode)
+    scale = None
+    if word_vecs.dtype == np.int8:
+        scale = np.load(embeddings_scale_path(path))
+    elif word_vecs.dtype == np.dtype(dtype):
+        return word_vecs
+
+    vectors = np.empty(word_vecs.shape, dtype=dtype)
+    for start in range(0, len(word_vecs), chunk_size):
+        chunk = np.asarray(word_vecs[start:start+chunk_size], dtype='float32')
+        if scale is not None:
+            chunk *= scale[start:start+chunk_size, None]
+        vectors[start:start+chunk_size] = chunk
+    return vectors
+
+
+# METHODS FOR PRUNING THE VOCABULARY
+
+def count_ids(ids_paths, num_words, chunk_size=1000000):
+    """
+    number of occurrences of every word id in the ids matrices. If a matrix has
+    a header file, only the first 'length' ids of every row are counted (the
+    padding zeros are also the id of a real word), otherwise all of them
+    """
+    counts = np.zeros(num_words, dtype='int64')
+    for ids_path in ids_paths:
+        ids, _, lengths = load_ids_dataset(ids_path)
+        for start in range(0, len(ids), chunk_size):
+            chunk = np.asarray(ids[start:start+chunk_size])
+            if lengths is not None:
+                chunk = chunk[np.arange(chunk.shape[1]) < lengths[start:start+chunk_size, None]]
+            counts += np.bincount(chunk.ravel(), minlength=num_words)
+    return counts
+
+
+def prune_vocabulary(counts, unk_id, top_n=None, min_count=1):
+    """
+    ids of the words that are kept: the words with at least min_count
+    occurrences (by default, the words that appear in the ids matrices)
+    and, if top_n is given, only the top_n most frequent ones. The id 0,
+    the padding value, and the UNK id are always kept. The ids are in
+    their original order, so 0 is still the first one.
+    """
+    candidates = np.flatnonzero(counts >= min_count)
+    if top_n is not None and len(candidates) > top_n:
+        # most frequent first, the smallest id first for the same count
+        order = np.lexsort((candidates, -counts[candidates]))
+        candidates = candidates[order[:top_n]]
+    return np.union1d(candidates, [0, unk_id])
+
+
+def remap_ids_matrix(ids_path, mapping, output_path, chunk_size=1000000):
+    """
+    writes in output_path the ids matrix with every id replaced by mapping[id],
+    chunk by chunk, and copies its header file (lengths and labels do not change)
+    """
+    ids = np.load(ids_path, mmap_mode='r')
+    new_ids = np.lib.format.open_memmap(output_path, mode='w+', dtype='int32', shape=ids.shape)
+    for start in range(0, len(ids), chunk_size):
+        new_ids[start:start+chunk_size] = mapping[ids[start:start+chunk_size]]
+    new_ids.flush()
+    del new_ids
+
+    _, labels, lengths = load_ids_dataset(ids_path)
+    if lengths is not None:
+        save_ids_header(output_path, lengths, labels)
+
+
+def prune_embeddings(word_list_path, word_vecs_path, ids_paths, suffix='_pruned', top_n=None, min_count=1):
+    """
+    removes from the word list and the word vectors the words that are not used
+    (see prune_vocabulary) and remaps consistently all the ids matrices: the
+    removed words become UNK. The new files have the same names with suffix,
+    e.g. word_list_sg_6_pruned.npy. With a smaller embedding table a trainable
+    Embedding layer has less parameters to update and less moments for Adam.
+
+    :return: the ids of the kept words in the original vocabulary
+    """
+    vocabulary = Vocabulary.from_npy(word_list_path)
+    counts = count_ids(ids_paths, len(vocabulary))
+    kept = prune_vocabulary(counts, vocabulary.unk_id, top_n, min_count)
+
+    # old id -> new id, the removed words are mapped to the new id of UNK
+    mapping = np.empty(len(vocabulary), dtype='int32')
+    mapping.fill(np.searchsorted(kept, vocabulary.unk_id))
+    mapping[kept] = np.arange(len(kept))
+
+    def pruned_path(path):
+        return os.path.splitext(path)[0] + suffix + '.npy'
+
+    np.save(pruned_path(word_list_path), [vocabulary.words[i] for i in kept])
+    save_embeddings(pruned_path(word_vecs_path), load_embeddings(word_vecs_path)[kept])
+    for ids_path in ids_paths:
+        remap_ids_matrix(ids_path, mapping, pruned_path(ids_path))
+    return kept
+
+
+# UTILITIES FOR THE ANALYSIS OF THE WORD VECTORS
+
+def _normalize_rows(vectors):
+    """L2-normalizes the rows of a matrix, in float32. Rows of zeros are left unchanged"""
+    vectors = np.asarray(vectors, dtype='float32')
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class SimilarityEngine(object):
+    """
+    exact nearest neighbours of the words by cosine similarity. The word
+    vectors are L2-normalized once, then the similarities of one or many
+    query words with the whole vocabulary are a single matrix product,
+    and the top k are selected with argpartition instead of a full sort.
+    The normalized vectors can be stored in float32 or float16 and cached
+    on disk with save / load.
+    """
+
+    # rows of the table multiplied at a time when it is stored in float16,
+    # so that the float32 copy used for the product stays small
+    chunk_size = 65536
+
+    def __init__(self, word_vecs, words=None, dtype='float32', normalized=False):
+        """
+        :param word_vecs: matrix of the word vectors, one row per word
+        :param words: optional list of words, row i being the word of vector i
+        :param dtype: 'float32' or 'float16', storage type of the normalized vectors
+        :param normalized: True if word_vecs are already L2-normalized (e.g. loaded from the cache)
+        """
+        if normalized:
+            self.vectors = np.asarray(word_vecs, dtype=dtype)
+        else:
+            self.vectors = _normalize_rows(word_vecs).astype(dtype)
+
+        self.words = list(words) if words is not None else None
+        self.word_to_id = {word: idx for idx, word in enumerate(self.words)} if words is not None else None
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def similarities(self, word_ids):
+        """cosine similarities between the query words and every word, shape (len(word_ids), vocabulary size)"""
+        queries = np.asarray(self.vectors[np.atleast_1d(word_ids)], dtype='float32')
+
+        if self.vectors.dtype == np.float32:
+            return queries.dot(self.vectors.T)
+
+        sim = np.empty((len(queries), len(self.vectors)), dtype='float32')
+        for start in range(0, len(self.vectors), self.chunk_size):
+            chunk = np.asarray(self.vectors[start:start+self.chunk_size], dtype='float32')
+            sim[:, start:start+len(chunk)] = queries.dot(chunk.T)
+        return sim
+
+    def top_k(self, word_ids, k=8, exclude_self=True):
+        """
+        the k most similar words of every query word, in descending order of similarity
+
+        :param word_ids: id or list of ids of the query words
+        :param k: number of neighbours
+        :param exclude_self: True to skip the query word itself
+        :return: ids and similarities of the neighbours, both of shape (len(word_ids), k)
+        """
+        word_ids = np.atleast_1d(word_ids)
+        sim = self.similarities(word_ids)
+        if exclude_self:
+            sim[np.arange(len(word_ids)), word_ids] = -np.inf
+
+        # the query word itself is not a neighbour, so at most vocabulary size - 1 neighbours
+        k = min(k, sim.shape[1] - 1 if exclude_self else sim.shape[1])
+        rows = np.arange(len(word_ids))[:, None]
+        if k <= 0:
+            return np.empty((len(word_ids), 0), dtype='int64'), np.empty((len(word_ids), 0), dtype='float32')
+        nearest = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+        nearest_sim = sim[rows, nearest]
+
+        # only the k selected neighbours are sorted
+        order = np.argsort(-nearest_sim, axis=1)
+        return nearest[rows, order], nearest_sim[rows, order]
+
+    def nearest_words(self, word, k=8):
+        """list of the k words most similar to word"""
+        nearest, _ = self.top_k(self.word_to_id[word], k)
+        return [self.words[idx] for idx in nearest[0]]
+
+    def save(self, path):
+        """caches the normalized vectors (and the words) on disk"""
+        np.save(path, self.vectors)
+        if self.words is not None:
+            Vocabulary(self.words).save(os.path.splitext(path)[0] + '_words.txt')
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """loads the normalized vectors cached with save, optionally memory-mapped"""
+        vectors = np.load(path, mmap_mode=mmap_mode)
+        words_path = os.path.splitext(path)[0] + '_words.txt'
+        words = Vocabulary.load(words_path).words if os.path.exists(words_path) else None
+        return cls(vectors, words, dtype=vectors.dtype, normalized=True)
+
+
+class IVFIndex(object):
+    """
+    approximate nearest neighbours index (inverted file) over the word
+    vectors, in pure numpy. The normalized vectors are partitioned with
+    spherical k-means in num_lists clusters; a query is compared only to
+    the vectors of the num_probes clusters with the closest centroids.
+    num_lists and num_probes are the recall / latency knobs: more probes
+    give a higher recall and slower queries. The results have the same
+    format of SimilarityEngine.top_k, which gives the exact neighbours.
+    """
+
+    def __init__(self, word_vecs, words=None, num_lists=None, num_iterations=10, sample_size=100000, seed=1):
+        """
+        :param word_vecs: matrix of the word vectors, one row per word
+        :param words: optional list of words, row i being the word of vector i
+        :param num_lists: number of clusters, by default about 4 * sqrt(number of words)
+        :param num_iterations: iterations of k-means
+        :param sample_size: number of vectors used to train the centroids
+        :param seed: seed of the initialization of k-means
+        """
+        vectors = _normalize_rows(word_vecs)
+        if num_lists is None:
+            num_lists = int(4 * np.sqrt(len(vectors)))
+        num_lists = max(1, min(num_lists, len(vectors)))
+
+        random_state = np.random.RandomState(seed)
+        sample = vectors[random_state.choice(len(vectors), min(sample_size, len(vectors)), replace=False)]
+        centroids = self._train_centroids(sample, num_lists, num_iterations, random_state)
+        self._build(vectors, centroids, words)
+
+    @staticmethod
+    def _assign(vectors, centroids, chunk_size=65536):
+        """index of the closest centroid of every vector"""
+        assignments = np.empty(len(vectors), dtype='int32')
+        for start in range(0, len(vectors), chunk_size):
+            chunk = vectors[start:start+chunk_size]
+            assignments[start:start+len(chunk)] = np.argmax(chunk.dot(centroids.T), axis=1)
+        return assignments
+
+    def _train_centroids(self, sample, num_lists, num_iterations, random_state):
+        """spherical k-means: the centroids are the normalized means of their clusters"""
+        centroids = sample[random_state.choice(len(sample), num_lists, replace=False)]
+        for _ in range(num_iterations):
+            assignments = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+
+            # empty clusters keep their previous centroid
+            empty = np.bincount(assignments, minlength=num_lists) == 0
+            sums[empty] = centroids[empty]
+            centroids = _normalize_rows(sums)
+        return centroids
+
+    def _build(self, vectors, centroids, words):
+        """stores the vectors grouped by cluster, contiguous in memory"""
+        assignments = self._assign(vectors, centroids)
+        order = np.argsort(assignments, kind='mergesort')
+
+        self.centroids = centroids
+        self.vectors = vectors[order]
+        self.ids = order.astype('int32')
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=len(centroids)))))
+        self.words = list(words) if words is not None else None
+        self.word_to_id = {word: idx for idx, word in enumerate(self.words)} if words is not None else None
+
+        # position of every word in self.vectors, to find the vector of a query word
+        self.positions = np.empty(len(order), dtype='int32')
+        self.positions[order] = np.arange(len(order))
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, queries, k=8, num_probes=8, exclude_ids=None):
+        """
+        approximate top k neighbours of query vectors
+
+        :param queries: matrix of query vectors, one per row (normalized or not)
+        :param k: number of neighbours
+        :param num_probes: number of clusters visited by every query
+        :param exclude_ids: optional id to skip for every query (e.g. the query word itself)
+        :return: ids and similarities of the neighbours, both of shape (len(queries), k).
+                 If less than k candidates are found the row is padded with id -1
+        """
+        queries = _normalize_rows(np.atleast_2d(queries))
+        num_probes = min(num_probes, len(self.centroids))
+
+        nearest = np.full((len(queries), k), -1, dtype='int32')
+        nearest_sim = np.full((len(queries), k), -np.inf, dtype='float32')
+
+        probes = np.argpartition(-queries.dot(self.centroids.T), num_probes - 1, axis=1)[:, :num_probes]
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+            if exclude_ids is not None:
+                # the excluded word is removed, so that it cannot fill a row with too few candidates
+                candidates = candidates[self.ids[candidates] != exclude_ids[row]]
+            sim = self.vectors[candidates].dot(query)
+
+            found = min(k, len(candidates))
+            if found == 0:
+                continue
+            best = np.argpartition(-sim, found - 1)[:found]
+            best = best[np.argsort(-sim[best])]
+            nearest[row, :found] = self.ids[candidates[best]]
+            nearest_sim[row, :found] = sim[best]
+
+        return nearest, nearest_sim
+
+    def top_k(self, word_ids, k=8, num_probes=8, exclude_self=True):
+        """approximate top k neighbours of words of the index, like SimilarityEngine.top_k"""
+        word_ids = np.atleast_1d(word_ids)
+        queries = self.vectors[self.positions[word_ids]]
+        return self.search(queries, k, num_probes, exclude_ids=word_ids if exclude_self else None)
+
+    def nearest_words(self, word, k=8, num_probes=8):
+        """list of the k words most similar to word, approximately"""
+        nearest, _ = self.top_k(self.word_to_id[word], k, num_probes)
+        return [self.words[idx] for idx in nearest[0] if idx >= 0]
+
+    @staticmethod
+    def _npz_path(path):
+        """path of the .npz file of the index (np.savez adds the extension if it is missing)"""
+        return path if path.endswith('.npz') else path + '.npz'
+
+    def save(self, path):
+        """saves the index in a .npz file (and the words in a text file next to it)"""
+        path = self._npz_path(path)
+        np.savez(path, centroids=self.centroids, vectors=self.vectors, ids=self.ids, offsets=self.offsets)
+        if self.words is not None:
+            Vocabulary(self.words).save(os.path.splitext(path)[0] + '_words.txt')
+
+    @classmethod
+    def load(cls, path):
+        """loads an index saved with save, with or without the .npz extension in path"""
+        path = cls._npz_path(path)
+        index = cls.__new__(cls)
+        data = np.load(path)
+        words_path = os.path.splitext(path)[0] + '_words.txt'
+
+        index.centroids = data['centroids']
+        index.vectors = data['vectors']
+        index.ids = data['ids']
+        index.offsets = data['offsets']
+        index.words = Vocabulary.load(words_path).words if os.path.exists(words_path) else None
+        index.word_to_id = {word: idx for idx, word in enumerate(index.words)} if index.words is not None else None
+        index.positions = np.empty(len(index.ids), dtype='int32')
+        index.positions[index.ids] = np.arange(len(index.ids))
+        return index
 
 
 # UTILITY FOR CREATING THE KAGGLE SUBMISSION
 
-def keras_prediction(model_path, weights_path, ids_test_path, csv_file_name):
+def _iter_chunks(rows, chunk_size):
+    """
+    yields chunks of rows as numpy arrays. rows can be an array (or a memory-mapped
+    array, sliced chunk by chunk) or any iterable of rows (e.g. a generator)
+    """
+    if hasattr(rows, 'shape'):
+        for start in range(0, rows.shape[0], chunk_size):
+            yield np.asarray(rows[start:start+chunk_size])
+    else:
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield np.asarray(chunk)
+
+
+class PredictionCache(object):
+    """
+    cache in front of the prediction function of a model, for the rows of
+    ids that are identical (retweets and duplicated tweets are the same
+    after the cleaning). The identical rows of a batch are predicted only
+    once, and the predictions of the last max_size distinct rows are kept
+    (least recently used are removed first), so a row already seen in a
+    previous batch is not predicted again.
+
+    cache = PredictionCache(model_predict)
+    predictions = cache(ids)
+    print(cache.stats())
+    """
+
+    def __init__(self, predict, max_size=100000):
+        """
+        :param predict: function that predicts a matrix of ids rows (or of their word vectors), one result per row
+        :param max_size: maximum number of rows kept in the cache
+        """
+        self.predict = predict
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+
+        self.num_rows = 0
+        self.num_unique = 0
+        self.num_hits = 0
+
+    def __call__(self, ids):
+        ids = np.ascontiguousarray(ids)
+        if len(ids) == 0:
+            return self.predict(ids)
+
+        # every row seen as a single value of its bytes, so that np.unique compares whole rows
+        # (a row can have more than one dimension, e.g. the word vectors of a row of ids)
+        rows = ids.reshape(len(ids), -1)
+        rows = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+        unique_rows, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+        keys = [row.tobytes() for row in unique_rows]
+
+        results = [None] * len(keys)
+        missing = []
+        for i, key in enumerate(keys):
+            result = self.entries.get(key)
+            if result is None:
+                missing.append(i)
+            else:
+                self.entries.move_to_end(key)
+                results[i] = result
+
+        if missing:
+            predictions = self.predict(ids[first[missing]])
+            for i, prediction in zip(missing, predictions):
+                results[i] = prediction
+                self.entries[keys[i]] = prediction
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+        self.num_rows += len(ids)
+        self.num_unique += len(keys)
+        self.num_hits += len(keys) - len(missing)
+        return np.array(results)[inverse.ravel()]
+
+    def stats(self):
+        """
+        number of rows, of rows predicted by the model and of rows found in the cache;
+        hit_rate is the fraction of the rows that were not predicted by the model
+        """
+        num_predicted = self.num_unique - self.num_hits
+        return {
+            'rows': self.num_rows,
+            'duplicates_in_batch': self.num_rows - self.num_unique,
+            'cache_hits': self.num_hits,
+            'predicted': num_predicted,
+            'hit_rate': 1 - num_predicted / float(self.num_rows) if self.num_rows else 0.,
+        }
+
+
+class Predictor(object):
+    """
+    loads a Keras model (json + weights) once and predicts ids rows
+    chunk by chunk. The model is not compiled, as it is not needed for
+    inference. Only one chunk of rows and its predictions are in memory
+    at a time, so the memory used depends on chunk_size and not on the
+    number of tweets.
+    """
+
+    def __init__(self, model_path, weights_path, chunk_size=10000, batch_size=1000, fused=False,
+                 cache_size=None):
+        """
+        :param model_path: json file of the model
+        :param weights_path: h5 file of the weights
+        :param chunk_size: number of rows read and predicted at a time
+        :param batch_size: batch size used by Keras inside a chunk
+        :param fused: if True, the convolutional layers with different kernel
+                      sizes are replaced by their fused version (see fuse_conv_blocks)
+        :param cache_size: if given, the identical rows are predicted only once,
+                           with a PredictionCache of cache_size rows (self.cache)
+        """
+        with open(model_path, 'r') as json_file:
+            self.model = model_from_json(json_file.read())
+        self.model.load_weights(weights_path)
+        if fused:
+            self.model = fuse_conv_blocks(self.model)
+        print("Loaded model from disk")
+
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.cache = None
+        if cache_size is not None:
+            self.cache = PredictionCache(self._predict_model, cache_size)
+
+    def _predict_model(self, ids):
+        return self.model.predict(ids, batch_size=self.batch_size, verbose=0).reshape(-1)
+
+    def predict_proba(self, ids):
+        """probability of being positive of every row of ids"""
+        if self.cache is not None:
+            return self.cache(ids)
+        return self._predict_model(ids)
+
+    def iter_predictions(self, rows):
+        """
+        yields, chunk by chunk, the labels (1 / -1) and the probabilities of the rows
+
+        :param rows: ids matrix (also memory-mapped) or iterable of ids rows
+        """
+        for chunk in _iter_chunks(rows, self.chunk_size):
+            probabilities = self.predict_proba(chunk)
+            labels = np.where(probabilities >= 0.5, 1, -1)
+            yield labels, probabilities
+
+    def predict_to_submission(self, rows, csv_file_name):
+        """writes the Kaggle submission of the rows, chunk by chunk"""
+        with SubmissionWriter(csv_file_name) as writer:
+            for labels, _ in self.iter_predictions(rows):
+                writer.write(labels)
+                print('Prediction number: ', writer.num_rows)
+        return writer.num_rows
+
+    def predict_text_to_submission(self, lines, wordsList, csv_file_name, max_seq_length=20, strip_id=True,
+                                   prefetch_chunks=2):
+        """
+        writes the Kaggle submission of raw tweets (e.g. iter_lines of test_data.txt),
+        without creating the ids matrix file: a background thread cleans the
+        tweets and converts them to ids chunk by chunk (see iter_ids_chunks) while
+        the model predicts the previous chunk. At most prefetch_chunks chunks
+        are waiting, so the memory used does not depend on the number of tweets.
+        """
+        chunks = prefetch(iter_ids_chunks(lines, wordsList, max_seq_length, self.chunk_size, strip_id),
+                          prefetch_chunks)
+        with SubmissionWriter(csv_file_name) as writer:
+            for ids in chunks:
+                probabilities = self.predict_proba(ids)
+                writer.write(np.where(probabilities >= 0.5, 1, -1))
+                print('Prediction number: ', writer.num_rows)
+        return writer.num_rows
+
+
+def keras_prediction(model_path, weights_path, ids_test_path, csv_file_name, cache_size=100000):
     """
     creates a csv file (csv_file_name) with prediction
     on test data (ids_test_path) using a model
     (model_path) with its weights (weights_path).
+    The ids matrix is memory-mapped and predicted in chunks;
+    the identical rows are predicted only once (see PredictionCache).
     """
 
-    # load json and create model
-    json_file = open(model_path, 'r')
-    loaded_model_json = json_file.read()
-    json_file.close()
-    loaded_model = model_from_json(loaded_model_json)
+    predictor = Predictor(model_path, weights_path, cache_size=cache_size)
 
-    # load weights into new model
-    loaded_model.load_weights(weights_path)
-    print("Loaded model from disk")
+    # loading the ids matrix of the test set
+    ids_test = np.load(ids_test_path, mmap_mode='r')
 
-    loaded_model.compile(loss='binary_crossentropy', optimizer='adam', metrics=['accuracy'])
+    predictor.predict_to_submission(ids_test, csv_file_name)
+    if predictor.cache is not None:
+        print('Prediction cache: ', predictor.cache.stats())
 
-    # loading the ids matrix of the test set
-    ids_test = np.load(ids_test_path)
 
-    prediction = loaded_model.predict(ids_test, verbose=0)
+def text_prediction(model_path, weights_path, text_path, words_list_path, csv_file_name, max_seq_length=20):
+    """
+    creates a csv file (csv_file_name) with prediction on the raw
+    test data file (text_path, lines "id,tweet") using a model
+    (model_path) with its weights (weights_path) and the word list
+    of its word vectors (words_list_path). The tweets are read, converted
+    to ids and predicted in one pass, without the ids matrix file.
+    """
+
+    predictor = Predictor(model_path, weights_path)
+    vocabulary = Vocabulary.from_npy(words_list_path)
 
-    prediction[prediction >= 0.5] = 1
-    prediction[prediction < 0.5] = -1
-    prediction = prediction.reshape(-1)
-    print(prediction)
-    make_submission(prediction, csv_file_name)
+    predictor.predict_text_to_submission(iter_lines([text_path]), vocabulary, csv_file_name, max_seq_length)
 
 
-def make_submission(pred, filename, from_tf=False):
+def load_model_without_embedding(model_path, weights_path):
     """
-    utily method to create a .csv file with the right
-    format for the Kaggle submission
+    loads a Sequential Keras model (json and h5 files) without its first layer,
+    an Embedding layer that was not trained (trainable False): the model takes
+    the word vectors of the rows (batch x max sequence length x dimensions)
+    instead of their ids, and the copy of the word vectors saved in the weights
+    is not loaded, so that one matrix of word vectors can be used by many models.
+    Returns None if the first layer is not an Embedding layer or if it was trained.
     """
-    indices = np.arange(len(pred))
-    df = pd.DataFrame()
+    with open(model_path, 'r') as json_file:
+        config = json.loads(json_file.read())
+    # the layers are in 'config' (Keras 2.1) or in config['layers'] (later versions)
+    layers = config['config'] if isinstance(config['config'], list) else config['config']['layers']
+
+    embedding = layers[0]['config']
+    if layers[0]['class_name'] != 'Embedding' or embedding.get('trainable', True):
+        return None
+
+    # the first layer left takes the output of the Embedding layer
+    max_seq_length = embedding.get('input_length') or embedding['batch_input_shape'][1]
+    del layers[0]
+    layers[0]['config']['batch_input_shape'] = [None, max_seq_length, embedding['output_dim']]
+    layers[0]['config']['dtype'] = 'float32'
+
+    model = model_from_json(json.dumps(config))
+    # the weights of the other layers are found by their name, the ones of the Embedding layer are skipped
+    model.load_weights(weights_path, by_name=True)
+    return model
 
-    for elem, idx in zip(pred, indices):
-        if idx % 100 == 0:
-            print('Prediction number: ', idx)
 
-        if from_tf:
-            final_pred = np.argmax(elem)
-            if final_pred == 0:
-                final_pred = 1
-            else:
-                final_pred = -1
+def submission_labels(pred, from_tf=False):
+    """
+    converts a whole array of predictions to the Kaggle labels (1 / -1).
+    With from_tf, pred contains the two logits of the TensorFlow model
+    and the label is 1 if the first one is the highest, otherwise
+    pred already contains 1 / -1 values (see keras_prediction)
+    """
+    pred = np.asarray(pred)
+    if from_tf:
+        pred = pred.reshape(len(pred), -1)
+        return np.where(np.argmax(pred, axis=1) == 0, 1, -1)
+    return pred.reshape(-1).astype(int)
 
-        else:
-            final_pred = int(elem)
 
-        df = df.append([[idx+1, final_pred]], ignore_index=True)
+class SubmissionWriter(object):
+    """
+    writes the Kaggle submission csv file chunk by chunk, so that
+    the predictions never have to be all in memory at the same time.
+    The ids continue from one chunk to the next, starting from 1.
+
+    with SubmissionWriter('prediction.csv') as writer:
+        writer.write(first_chunk)
+        writer.write(second_chunk)
+    """
+
+    def __init__(self, filename, from_tf=False):
+        self.filename = filename
+        self.from_tf = from_tf
+        self.num_rows = 0
+        self.last_rows = None
+        # no newline translation: pandas writes its own line endings (no \r\r\n on Windows)
+        self._file = open(filename, 'w', newline='')
+        self._file.write('Id,Prediction\n')
+
+    def write(self, pred):
+        """appends a chunk of predictions, in the same format given to make_submission"""
+        labels = submission_labels(pred, self.from_tf)
+        ids = np.arange(self.num_rows + 1, self.num_rows + len(labels) + 1)
+
+        chunk = pd.DataFrame({'Id': ids, 'Prediction': labels}, columns=['Id', 'Prediction'])
+        chunk.to_csv(self._file, index=False, header=False)
+
+        self.num_rows += len(labels)
+        if len(labels) > 0:
+            self.last_rows = chunk
 
-    df.columns = ['Id', 'Prediction']
-    print(df.tail())
+    def close(self):
+        self._file.close()
 
-    df.to_csv(filename, index=False)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def make_submission(pred, filename, from_tf=False, chunk_size=100000):
+    """
+    utily method to create a .csv file with the right
+    format for the Kaggle submission. The predictions are
+    converted all at once and written in chunks of chunk_size rows
+    """
+    with SubmissionWriter(filename, from_tf=from_tf) as writer:
+        for start in range(0, len(pred), chunk_size):
+            writer.write(pred[start:start+chunk_size])
+            print('Prediction number: ', writer.num_rows)
+
+    if writer.last_rows is not None:
+        print(writer.last_rows.tail())
 
 
 # UTILITY METHOD FOR CREATION OF A CONVOLUTIONAL LAYER IN KERAS
@@ -281,6 +1809,191 @@ def conv_different_kernels(num_filters, kernel_sizes, max_sentence_length, input
     return model
 
 
+def _same_padding(kernel_sizes):
+    """
+    left padding of every kernel size with padding='same' (the extra zero
+    goes on the right), the left padding and the width of a single kernel
+    that contains all the kernels aligned as with padding='same'
+    """
+    lefts = [(kernel_size - 1) // 2 for kernel_size in kernel_sizes]
+    pad_left = max(lefts)
+    width = max(pad_left - left + kernel_size for left, kernel_size in zip(lefts, kernel_sizes))
+    return lefts, pad_left, width
+
+
+def _channels(x, start, end):
+    """channels from start to end of the output of a convolution"""
+    return x[:, :, start:end]
+
+
+def conv_different_kernels_fused(num_filters, kernel_sizes, max_sentence_length, input_dim):
+    """
+    same layer of conv_different_kernels, with the same outputs, but the
+    filters of all the kernel sizes are computed by a single convolution:
+    the kernels are placed, padded with zeros, in a kernel as wide as the
+    largest one, so the input is read once instead of once per kernel size.
+    The weights of a conv_different_kernels layer are converted with
+    fused_conv_weights (see also fuse_conv_blocks).
+
+    :param num_filters:
+    :param kernel_sizes: list of the values of the kernel sizes
+    :param max_sentence_length: length of the sentence
+    :param input_dim: dimension of the input
+    :return:
+    """
+
+    _, pad_left, width = _same_padding(kernel_sizes)
+
+    input_ = Input(shape=input_dim)
+    padded = ZeroPadding1D((pad_left, width - 1 - pad_left))(input_)
+    convolution = Conv1D(filters=num_filters * len(kernel_sizes), kernel_size=width, padding='valid',
+                         activation='relu')(padded)
+
+    pooling_layers = []
+    for i, kernel_size in enumerate(kernel_sizes):
+        layer = Lambda(_channels, arguments={'start': i * num_filters, 'end': (i + 1) * num_filters})(convolution)
+
+        layer = MaxPooling1D((max_sentence_length - kernel_size + 1), padding='same')(layer)
+
+        pooling_layers.append(layer)
+
+    if len(pooling_layers) > 1:
+        merged = keras.layers.concatenate(pooling_layers, axis=1)
+
+    else:
+        merged = pooling_layers[0]
+
+    model = Model(input_, outputs=merged)
+    return model
+
+
+def fused_conv_weights(conv_weights, kernel_sizes):
+    """
+    converts the weights of the Conv1D layers of conv_different_kernels
+    ([kernel, bias] of every kernel size, in order) to the weights of the
+    single Conv1D layer of conv_different_kernels_fused
+    """
+    lefts, pad_left, width = _same_padding(kernel_sizes)
+    input_dim, num_filters = conv_weights[0][0].shape[1:]
+
+    kernel = np.zeros((width, input_dim, num_filters * len(kernel_sizes)), dtype=conv_weights[0][0].dtype)
+    for i, ((branch_kernel, _), left, kernel_size) in enumerate(zip(conv_weights, lefts, kernel_sizes)):
+        start = pad_left - left
+        kernel[start:start+kernel_size, :, i*num_filters:(i+1)*num_filters] = branch_kernel
+    bias = np.concatenate([branch_bias for _, branch_bias in conv_weights])
+    return [kernel, bias]
+
+
+def fuse_conv_blocks(model):
+    """
+    returns a copy of a Sequential Keras model (e.g. loaded from run_model.json
+    and run_weights.h5) where every conv_different_kernels layer is replaced by
+    a conv_different_kernels_fused layer with the same weights. The other
+    layers are shared with the original model.
+    """
+    input_ = Input(batch_shape=model.input_shape, dtype=model.input.dtype)
+    x = input_
+    for layer in model.layers:
+        if isinstance(layer, keras.layers.InputLayer):
+            continue
+        conv_layers = [l for l in getattr(layer, 'layers', []) if isinstance(l, Conv1D)]
+        if conv_layers:
+            kernel_sizes = [conv.kernel_size[0] for conv in conv_layers]
+            fused = conv_different_kernels_fused(conv_layers[0].filters, kernel_sizes,
+                                                 max_sentence_length=layer.input_shape[1],
+                                                 input_dim=layer.input_shape[1:])
+            fused.set_weights(fused_conv_weights([conv.get_weights() for conv in conv_layers], kernel_sizes))
+            layer = fused
+        x = layer(x)
+    return Model(input_, outputs=x)
+
+
+# OPTIMIZER FOR THE TRAINABLE EMBEDDING LAYER IN KERAS
+class SparseAdam(keras.optimizers.Adam):
+    """
+    Adam optimizer (same parameters and same updates of keras.optimizers.Adam)
+    that updates lazily the word vectors of a trainable Embedding layer.
+    The gradient of the embedding matrix has only the rows of the words of
+    the batch (at most batch size x max sequence length), so only these rows
+    of the matrix and of its moments are updated, instead of the whole
+    matrix at every step. As in the lazy Adam of TensorFlow, the moments of
+    the other rows are not decayed in the meantime. With amsgrad, the
+    maximum of the second moments is also updated only for these rows.
+    A constraint of the variable (e.g. max norm of the word vectors) is still
+    applied to the whole matrix, as in Adam.
+    Needs the TensorFlow backend.
+    """
+
+    def get_updates(self, loss, params):
+        # TensorFlow is imported only here, the other utilities of this file do not need it
+        import tensorflow as tf
+
+        amsgrad = getattr(self, 'amsgrad', False)
+        grads = self.get_gradients(loss, params)
+        self.updates = [K.update_add(self.iterations, 1)]
+
+        lr = self.lr
+        if self.initial_decay > 0:
+            lr *= (1. / (1. + self.decay * K.cast(self.iterations, K.dtype(self.decay))))
+
+        t = K.cast(self.iterations, K.floatx()) + 1
+        lr_t = lr * (K.sqrt(1. - K.pow(self.beta_2, t)) / (1. - K.pow(self.beta_1, t)))
+
+        ms = [K.zeros(K.int_shape(p), dtype=K.dtype(p)) for p in params]
+        vs = [K.zeros(K.int_shape(p), dtype=K.dtype(p)) for p in params]
+        if amsgrad:
+            vhats = [K.zeros(K.int_shape(p), dtype=K.dtype(p)) for p in params]
+        else:
+            vhats = [K.zeros(1) for _ in params]
+        self.weights = [self.iterations] + ms + vs + vhats
+
+        for p, g, m, v, vhat in zip(params, grads, ms, vs, vhats):
+            if isinstance(g, tf.IndexedSlices):
+                # a word can appear more than once in the batch: the gradients of its row are summed
+                rows, positions = tf.unique(g.indices)
+                g_rows = tf.unsorted_segment_sum(g.values, positions, tf.shape(rows)[0])
+
+                m_rows = (self.beta_1 * tf.gather(m, rows)) + (1. - self.beta_1) * g_rows
+                v_rows = (self.beta_2 * tf.gather(v, rows)) + (1. - self.beta_2) * K.square(g_rows)
+                if amsgrad:
+                    vhat_rows = K.maximum(tf.gather(vhat, rows), v_rows)
+                    p_rows = tf.gather(p, rows) - lr_t * m_rows / (K.sqrt(vhat_rows) + self.epsilon)
+                    self.updates.append(tf.scatter_update(vhat, rows, vhat_rows))
+                else:
+                    p_rows = tf.gather(p, rows) - lr_t * m_rows / (K.sqrt(v_rows) + self.epsilon)
+
+                self.updates.append(tf.scatter_update(m, rows, m_rows))
+                self.updates.append(tf.scatter_update(v, rows, v_rows))
+                new_p = tf.scatter_update(p, rows, p_rows)
+
+                # Apply constraints (to the whole variable, as in the dense case).
+                if getattr(p, 'constraint', None) is not None:
+                    new_p = K.update(p, p.constraint(new_p))
+
+                self.updates.append(new_p)
+                continue
+
+            m_t = (self.beta_1 * m) + (1. - self.beta_1) * g
+            v_t = (self.beta_2 * v) + (1. - self.beta_2) * K.square(g)
+            if amsgrad:
+                vhat_t = K.maximum(vhat, v_t)
+                p_t = p - lr_t * m_t / (K.sqrt(vhat_t) + self.epsilon)
+                self.updates.append(K.update(vhat, vhat_t))
+            else:
+                p_t = p - lr_t * m_t / (K.sqrt(v_t) + self.epsilon)
+
+            self.updates.append(K.update(m, m_t))
+            self.updates.append(K.update(v, v_t))
+            new_p = p_t
+
+            # Apply constraints.
+            if getattr(p, 'constraint', None) is not None:
+                new_p = p.constraint(new_p)
+
+            self.updates.append(K.update(p, new_p))
+        return self.updates
+
+
 # CLASS AND METHODS TO SAVE METRICS FROM OUR MODELS
 class History(keras.callbacks.Callback):
     """
@@ -0,0 +1,461 @@
+"""
+keras_data_parallel.py: This file contains the data-parallel training of our Keras models
+on CPU (fit_data_parallel), used by 'run.py' when num_workers > 1. The model is trained by
+num_workers processes at the same time, started by fit_data_parallel: every process computes
+the gradients of its part of every batch, the gradients of all the processes are summed with
+a ring all-reduce over local sockets (RingAllReduce), and every process applies the same
+averaged gradients with its own copy of the optimizer, so that all the copies of the model
+stay the same. The batches are the ones of fit_generator with batch_generator (same order,
+same batch_size), so the updates are the same of the training in a single process: only the
+gradients of every batch are computed in parallel.
+
+The gradients of the trainable Embedding layer are sent as rows (only the words of the batch),
+the other gradients as a single vector. The processes read the rows of the batches from the
+memory-mapped ids matrix, so the ids are not copied for every process.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import pickle
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tensorflow as tf
+from helpers import *
+
+
+class RingAllReduce(object):
+    """
+    ring of the worker processes, connected with sockets: every process sends
+    to the next one and receives from the previous one. allreduce sums an
+    array over all the processes, every process sending and receiving only
+    2 x (num_workers - 1) / num_workers times the size of the array.
+    With a single process, nothing is sent.
+    """
+
+    def __init__(self, rank, num_workers, ports, host='localhost', timeout=60):
+        """
+        :param rank: position of this process in the ring, from 0 to num_workers - 1
+        :param num_workers: number of processes
+        :param ports: port on which every process listens for the previous one
+        :param timeout: seconds to wait for the next process to listen
+        """
+        self.rank = rank
+        self.num_workers = num_workers
+        if num_workers == 1:
+            return
+
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, ports[rank]))
+        server.listen(1)
+
+        # the next process may not be listening yet
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self.next = socket.create_connection((host, ports[(rank + 1) % num_workers]))
+                break
+            except ConnectionRefusedError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+        self.previous, _ = server.accept()
+        server.close()
+
+        for connection in (self.next, self.previous):
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _exchange(self, data, num_bytes):
+        """sends data to the next process while receiving num_bytes bytes from the previous one"""
+        sender = threading.Thread(target=self.next.sendall, args=(data,))
+        sender.start()
+
+        received = bytearray(num_bytes)
+        view = memoryview(received)
+        position = 0
+        while position < num_bytes:
+            size = self.previous.recv_into(view[position:])
+            if size == 0:
+                raise ConnectionError('the previous process of the ring closed the connection')
+            position += size
+
+        sender.join()
+        return received
+
+    def allreduce(self, vector):
+        """
+        sum of a float32 vector over all the processes: the vector is split in
+        num_workers parts, every part is summed along the ring (reduce-scatter)
+        and then sent to all the processes (all-gather), so that all the
+        processes get exactly the same values
+        """
+        vector = np.array(vector, dtype='float32')
+        num_workers = self.num_workers
+        if num_workers == 1:
+            return vector
+
+        bounds = np.linspace(0, len(vector), num_workers + 1).astype(int)
+
+        def part(i):
+            return vector[bounds[i]:bounds[i+1]]
+
+        for step in range(num_workers - 1):
+            send = (self.rank - step) % num_workers
+            receive = (self.rank - step - 1) % num_workers
+            received = self._exchange(part(send).tobytes(), part(receive).nbytes)
+            part(receive)[:] += np.frombuffer(received, dtype='float32')
+
+        # now this process has the whole sum of the part rank + 1
+        for step in range(num_workers - 1):
+            send = (self.rank - step + 1) % num_workers
+            receive = (self.rank - step) % num_workers
+            received = self._exchange(part(send).tobytes(), part(receive).nbytes)
+            part(receive)[:] = np.frombuffer(received, dtype='float32')
+        return vector
+
+    def allgather(self, array):
+        """
+        arrays of all the processes, in the order of their rank. The arrays have the
+        same dtype and the same shape but the first dimension (number of rows)
+        """
+        if self.num_workers == 1:
+            return [array]
+
+        array = np.ascontiguousarray(array)
+        row_shape = array.shape[1:]
+        row_bytes = array.dtype.itemsize * int(np.prod(row_shape))
+
+        arrays = [None] * self.num_workers
+        arrays[self.rank] = array
+        piece = array
+        for step in range(self.num_workers - 1):
+            # the number of rows first, then the rows
+            num_rows = self._exchange(np.array([len(piece)], dtype='int64').tobytes(), 8)
+            num_rows = int(np.frombuffer(num_rows, dtype='int64')[0])
+            received = self._exchange(piece.tobytes(), num_rows * row_bytes)
+            piece = np.frombuffer(received, dtype=array.dtype).reshape((num_rows,) + row_shape)
+            arrays[(self.rank - step - 1) % self.num_workers] = piece
+        return arrays
+
+    def close(self):
+        if self.num_workers > 1:
+            self.next.close()
+            self.previous.close()
+
+
+class DataParallelTrainer(object):
+    """
+    training step of a copy of a Keras model in a worker process: computes the loss,
+    the accuracy and the gradients of the part of the batch of this process, sums them
+    over all the processes and updates the weights with the averaged gradients
+    """
+
+    def __init__(self, model, optimizer, loss, ring):
+        """
+        :param model: Keras model, with the same weights in all the processes
+        :param optimizer: Keras optimizer, it applies the averaged gradients
+        :param loss: name of the loss (e.g. 'binary_crossentropy')
+        :param ring: RingAllReduce of the processes
+        """
+        self.ring = ring
+        self.params = model.trainable_weights
+
+        y_true = K.placeholder(ndim=2)
+        loss_tensor = K.mean(keras.losses.get(loss)(y_true, model.output))
+        accuracy = K.mean(keras.metrics.binary_accuracy(y_true, model.output))
+        grads = K.gradients(loss_tensor, self.params)
+
+        # the gradient of an Embedding layer has only the rows of the words of the batch (IndexedSlices):
+        # it is computed and applied as values and indices, the other gradients as dense arrays
+        self.sparse = [isinstance(grad, tf.IndexedSlices) for grad in grads]
+        fetches = []
+        applied = []
+        self.grad_inputs = []
+        for grad in grads:
+            if isinstance(grad, tf.IndexedSlices):
+                fetches += [grad.values, grad.indices]
+                values = tf.placeholder(grad.values.dtype, grad.values.get_shape())
+                indices = tf.placeholder(grad.indices.dtype, [None])
+                applied.append(tf.IndexedSlices(values, indices, grad.dense_shape))
+                self.grad_inputs += [values, indices]
+            else:
+                fetches.append(grad)
+                placeholder = tf.placeholder(grad.dtype, grad.get_shape())
+                applied.append(placeholder)
+                self.grad_inputs.append(placeholder)
+
+        # the optimizer applies the gradients given to apply_gradients instead of computing them
+        optimizer.get_gradients = lambda loss, params: applied
+        updates = optimizer.get_updates(loss=loss_tensor, params=self.params)
+
+        inputs = [model.input, y_true, K.learning_phase()]
+        self.compute_gradients = K.function(inputs, [loss_tensor, accuracy] + fetches)
+        self.compute_metrics = K.function(inputs, [loss_tensor, accuracy])
+        self.apply_gradients = K.function(self.grad_inputs, [], updates=updates)
+
+    def _zero_gradients(self):
+        """gradients of a process without rows in the batch"""
+        arrays = []
+        for param, sparse in zip(self.params, self.sparse):
+            shape = K.int_shape(param)
+            if sparse:
+                arrays += [np.zeros((0,) + shape[1:], dtype='float32'), np.zeros(0, dtype='int32')]
+            else:
+                arrays.append(np.zeros(shape, dtype='float32'))
+        return arrays
+
+    def train_step(self, x, y, weight):
+        """
+        updates the weights with the gradients of a batch, split between the processes
+
+        :param x: ids of the rows of this process
+        :param y: labels of the rows of this process
+        :param weight: fraction of the rows of the batch that are in x
+        :return: loss and accuracy of the whole batch
+        """
+        if len(x):
+            outputs = self.compute_gradients([x, np.reshape(y, (-1, 1)), 1])
+            loss, accuracy, arrays = outputs[0], outputs[1], outputs[2:]
+        else:
+            loss, accuracy, arrays = 0., 0., self._zero_gradients()
+
+        # the dense gradients, the loss and the accuracy are summed in a single vector,
+        # weighted by the number of rows of every process (the mean over the whole batch)
+        dense = [np.array([loss, accuracy]) * weight]
+        rows = []
+        position = 0
+        for sparse in self.sparse:
+            if sparse:
+                rows.append((arrays[position] * weight, arrays[position+1]))
+                position += 2
+            else:
+                dense.append(np.ravel(arrays[position]) * weight)
+                position += 1
+        dense = self.ring.allreduce(np.concatenate(dense))
+
+        feed = []
+        offset = 2
+        row_index = 0
+        for param, sparse in zip(self.params, self.sparse):
+            if sparse:
+                values, indices = rows[row_index]
+                row_index += 1
+                # the rows of all the processes, in the same order in every process
+                feed += [np.concatenate(self.ring.allgather(values.astype('float32'))),
+                         np.concatenate(self.ring.allgather(indices.astype('int32')))]
+            else:
+                shape = K.int_shape(param)
+                size = int(np.prod(shape))
+                feed.append(dense[offset:offset+size].reshape(shape))
+                offset += size
+        self.apply_gradients(feed)
+
+        return float(dense[0]), float(dense[1])
+
+    def evaluate(self, x, y, batch_size):
+        """loss and accuracy of all the rows of all the processes (x and y are the rows of this process)"""
+        totals = np.zeros(3, dtype='float32')
+        for start in range(0, len(x), batch_size):
+            x_batch = x[start:start+batch_size]
+            loss, accuracy = self.compute_metrics([x_batch, np.reshape(y[start:start+batch_size], (-1, 1)), 0])
+            totals += [loss * len(x_batch), accuracy * len(x_batch), len(x_batch)]
+        totals = self.ring.allreduce(totals)
+        return float(totals[0] / totals[2]), float(totals[1] / totals[2])
+
+
+def _train_worker(spec_path, rank):
+    """training in the worker process rank, described by the file written by fit_data_parallel"""
+    with open(spec_path, 'rb') as spec_file:
+        spec = pickle.load(spec_file)
+    num_workers = spec['num_workers']
+
+    # every process uses its share of the cores
+    threads = spec['threads_per_worker']
+    K.set_session(tf.Session(config=tf.ConfigProto(intra_op_parallelism_threads=threads,
+                                                   inter_op_parallelism_threads=threads)))
+
+    model = model_from_json(spec['model_json'])
+    model.load_weights(spec['initial_weights'])
+    optimizer = keras.optimizers.deserialize(spec['optimizer'], custom_objects={'SparseAdam': SparseAdam})
+
+    data = np.load(spec['data'])
+    x_train = RowView(np.load(spec['x_train'], mmap_mode='r'), data['train_indices'])
+    x_test = RowView(np.load(spec['x_test'], mmap_mode='r'), data['test_indices'])
+    y_train = data['y_train']
+    y_test = data['y_test']
+
+    ring = RingAllReduce(rank, num_workers, spec['ports'])
+    trainer = DataParallelTrainer(model, optimizer, spec['loss'], ring)
+
+    # every process has the same batches of fit_generator, and takes its part of every batch
+    batch_size = spec['batch_size']
+    positions = np.arange(len(x_train))
+    generator = batch_generator(positions, positions, batch_size, seed=spec['seed'])
+    train_steps = int(np.ceil(len(x_train) / batch_size))
+    # the rows of the test set are split once between the processes
+    test_rows = np.array_split(np.arange(len(x_test)), num_workers)[rank]
+
+    losses = []
+    accuracy = []
+    val_losses = []
+    val_accuracy = []
+    for epoch in range(spec['epochs']):
+        if rank == 0:
+            print('Epoch %d/%d' % (epoch + 1, spec['epochs']))
+        start = time.time()
+        for step in range(train_steps):
+            batch, _ = next(generator)
+            rows = np.array_split(batch, num_workers)[rank]
+            loss, acc = trainer.train_step(x_train[rows], y_train[rows], len(rows) / float(len(batch)))
+            losses.append(loss)
+            accuracy.append(acc)
+            if rank == 0 and (step + 1) % 100 == 0:
+                print('%d/%d - %.0fs - loss: %.4f - acc: %.4f'
+                      % (step + 1, train_steps, time.time() - start, np.mean(losses[-100:]),
+                         np.mean(accuracy[-100:])))
+
+        val_loss, val_acc = trainer.evaluate(x_test[test_rows], y_test[test_rows], batch_size)
+        val_losses.append(val_loss)
+        val_accuracy.append(val_acc)
+        if rank == 0:
+            print('%.0fs - val_loss: %.4f - val_acc: %.4f' % (time.time() - start, val_loss, val_acc))
+
+    ring.close()
+
+    # all the processes have the same weights, the first one saves them with the metrics
+    if rank == 0:
+        model.save_weights(spec['final_weights'])
+        np.savez(spec['metrics'], losses=losses, accuracy=accuracy, val_loss=val_losses, val_acc=val_accuracy)
+
+
+def _shared_rows(x, work_dir, name):
+    """
+    path of a matrix that the worker processes open memory-mapped, and indices of the
+    rows of x in it: the file of the memory-mapped matrix of a RowView, otherwise
+    the rows of x saved in work_dir
+    """
+    if isinstance(x, RowView) and isinstance(x.array, np.memmap) and x.array.filename is not None:
+        # a slice of the memory-mapped matrix has the same file, but not the same rows
+        if np.load(x.array.filename, mmap_mode='r').shape == x.array.shape:
+            return x.array.filename, x.indices
+
+    path = os.path.join(work_dir, name + '.npy')
+    np.save(path, np.asarray(x))
+    return path, np.arange(len(x))
+
+
+def _free_ports(number):
+    """ports that are not used on this machine"""
+    sockets = []
+    for _ in range(number):
+        free_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        free_socket.bind(('localhost', 0))
+        sockets.append(free_socket)
+    ports = [free_socket.getsockname()[1] for free_socket in sockets]
+    for free_socket in sockets:
+        free_socket.close()
+    return ports
+
+
+def fit_data_parallel(model, x_train, y_train, x_test, y_test, batch_size, epochs, num_workers, history=None,
+                      seed=1, threads_per_worker=None, work_dir=None):
+    """
+    trains a compiled Keras model with num_workers processes, as fit_generator with
+    batch_generator(x_train, y_train, batch_size) and the validation on the test set at the
+    end of every epoch. At the end, the model has the trained weights, and history (our History
+    callback) has the loss and the accuracy of every batch and the validation loss and accuracy
+    of every epoch, as after fit_generator.
+    Every process has its own copy of the model (and of the trainable word vectors), the
+    state of the optimizer of the model is not updated.
+
+    :param model: compiled Keras model (the loss and the optimizer given to compile are used)
+    :param x_train: ids matrix of the train set (also a RowView of a memory-mapped ids matrix)
+    :param y_train: labels of the train set
+    :param x_test: ids matrix of the test set used for the validation
+    :param y_test: labels of the test set
+    :param num_workers: number of processes
+    :param history: optional History callback filled with the metrics
+    :param seed: seed of the order of the batches (the one of batch_generator)
+    :param threads_per_worker: number of threads of TensorFlow in every process (default: cores / num_workers)
+    :param work_dir: directory of the files shared with the processes (default: a temporary directory, deleted at the end)
+    """
+    temporary_dir = work_dir is None
+    if temporary_dir:
+        work_dir = tempfile.mkdtemp(prefix='data_parallel_')
+    if threads_per_worker is None:
+        threads_per_worker = max(1, multiprocessing.cpu_count() // num_workers)
+
+    try:
+        x_train_path, train_indices = _shared_rows(x_train, work_dir, 'x_train')
+        x_test_path, test_indices = _shared_rows(x_test, work_dir, 'x_test')
+        data_path = os.path.join(work_dir, 'data.npz')
+        np.savez(data_path, train_indices=train_indices, test_indices=test_indices,
+                 y_train=np.asarray(y_train), y_test=np.asarray(y_test))
+
+        # all the processes start from the weights of the model
+        initial_weights_path = os.path.join(work_dir, 'initial_weights.h5')
+        model.save_weights(initial_weights_path)
+
+        spec = {
+            'model_json': model.to_json(),
+            'initial_weights': initial_weights_path,
+            'optimizer': keras.optimizers.serialize(model.optimizer),
+            'loss': model.loss,
+            'x_train': x_train_path,
+            'x_test': x_test_path,
+            'data': data_path,
+            'batch_size': batch_size,
+            'epochs': epochs,
+            'seed': seed,
+            'num_workers': num_workers,
+            'threads_per_worker': threads_per_worker,
+            'ports': _free_ports(num_workers),
+            'final_weights': os.path.join(work_dir, 'final_weights.h5'),
+            'metrics': os.path.join(work_dir, 'metrics.npz'),
+        }
+        spec_path = os.path.join(work_dir, 'spec.pkl')
+        with open(spec_path, 'wb') as spec_file:
+            pickle.dump(spec, spec_file)
+
+        workers = [subprocess.Popen([sys.executable, os.path.abspath(__file__), spec_path, str(rank)])
+                   for rank in range(num_workers)]
+        try:
+            # if a process fails, the others would wait for it forever
+            while True:
+                return_codes = [worker.poll() for worker in workers]
+                failed = [rank for rank, code in enumerate(return_codes) if code not in (None, 0)]
+                if failed:
+                    raise RuntimeError('the worker process %d of the data-parallel training failed' % failed[0])
+                if all(code == 0 for code in return_codes):
+                    break
+                time.sleep(1)
+        finally:
+            for worker in workers:
+                if worker.poll() is None:
+                    worker.kill()
+
+        model.load_weights(spec['final_weights'])
+        metrics = np.load(spec['metrics'])
+        if history is not None:
+            history.on_train_begin()
+            history.losses = list(metrics['losses'])
+            history.accuracy = list(metrics['accuracy'])
+            history.epocs_val_loss = list(metrics['val_loss'])
+            history.epocs_val_acc = list(metrics['val_acc'])
+    finally:
+        if temporary_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    # worker process started by fit_data_parallel: python keras_data_parallel.py <spec file> <rank>
+    _train_worker(sys.argv[1], int(sys.argv[2]))
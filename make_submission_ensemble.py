@@ -0,0 +1,146 @@
+"""
+make_submission_ensemble.py: This file contains the EnsemblePredictor, that predicts
+the tweets with our three architectures at the same time (the TensorFlow LSTM, the one
+kernel CNN_LSTM and the two kernels CNN_LSTM) and combines their predictions, by
+averaging the probabilities of being positive or by majority vote. Run this script,
+after having trained the three models, to create the csv file of the ensemble.
+
+The models are loaded once, in the same process, and the word vectors are loaded only
+once too (memory-mapped): every batch of ids is converted to word vectors a single time,
+and the models that use our word vectors as they are (the LSTM, and the Keras models with
+a non trainable Embedding layer) take these word vectors, instead of keeping a copy of the
+whole matrix each. A Keras model whose Embedding layer was trained (e.g. the one of our best
+score) keeps its own word vectors and takes the ids. The models predict every batch at the
+same time, on a pool of threads (TensorFlow releases the GIL while it runs).
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+from concurrent.futures import ThreadPoolExecutor
+from tf_lstm import *
+
+
+word_vecs_path = 'data/our_trained_wordvectors/wordvecs_sg_6.npy'
+ids_test_path = 'data/our_trained_wordvectors/ids_test_sg_6.npy'
+keras_models = [
+    # two kernels CNN_LSTM of our best score ('run.py')
+    ('data/kaggle_score_0.8594/kaggle_score_0.8594_model.json',
+     'data/kaggle_score_0.8594/kaggle_score_0.8594__weights.h5'),
+    # one kernel CNN_LSTM
+    ('scripts/one_kernel_CNN_LSTM_best_score/one_kernel_CNN_LSTM_model.json',
+     'scripts/one_kernel_CNN_LSTM_best_score/one_kernel_CNN_LSTM_weights.h5'),
+]
+lstm_checkpoint_dir = 'data/models'
+
+# 'average' of the probabilities or majority 'vote' of the labels of the models
+combine = 'average'
+
+
+class EnsemblePredictor(Predictor):
+    """
+    predicts the rows of ids with many models at the same time and combines
+    their predictions. It predicts the chunks of rows as a Predictor (see
+    predict_to_submission and predict_text_to_submission).
+
+    predictor = EnsemblePredictor(wordVectors, keras_models, 'data/models')
+    predictor.predict_to_submission(ids_test, 'ensemble_prediction.csv')
+    """
+
+    def __init__(self, word_vectors, keras_models, lstm_checkpoint_dir=None, combine='average', chunk_size=10000,
+                 batch_size=1000, cache_size=None):
+        """
+        :param word_vectors: word vectors matrix (also memory-mapped) used to train the models
+        :param keras_models: list of (json file of the model, h5 file of the weights)
+        :param lstm_checkpoint_dir: directory of the checkpoints of the TensorFlow LSTM, if it is used
+        :param combine: 'average' of the probabilities or majority 'vote' of the labels
+                        (with a tie, the tweet is positive)
+        :param chunk_size: number of rows read at a time
+        :param batch_size: number of rows converted to word vectors and predicted at a time
+        :param cache_size: if given, the identical rows are predicted only once (see PredictionCache)
+        """
+        if combine not in ('average', 'vote'):
+            raise ValueError("combine must be 'average' or 'vote', not %r" % combine)
+        self.word_vectors = word_vectors
+        self.combine = combine
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.cache = None
+        if cache_size is not None:
+            self.cache = PredictionCache(self._predict_model, cache_size)
+
+        # list of (name, function predicting the probabilities of a batch, True if it takes the word vectors)
+        self.models = []
+        for model_path, weights_path in keras_models:
+            model = load_model_without_embedding(model_path, weights_path)
+            embedded_input = model is not None
+            if model is None:
+                model = Predictor(model_path, weights_path).model
+            # the predictions are run by the threads of the pool: the predict function is built here
+            model._make_predict_function()
+            self.models.append((os.path.basename(model_path), self._keras_predict(model), embedded_input))
+            print('Loaded %s (%s)' % (model_path, 'shared word vectors' if embedded_input else 'own word vectors'))
+
+        self.lstm = None
+        if lstm_checkpoint_dir is not None:
+            self.lstm = LSTMPredictor(word_vectors, lstm_checkpoint_dir, embedded_input=True)
+            self.models.append(('lstm', self._lstm_predict(self.lstm), True))
+            print('Loaded the LSTM from ' + lstm_checkpoint_dir)
+
+        self.keras_graph = tf.get_default_graph()
+        self.pool = ThreadPoolExecutor(max_workers=len(self.models))
+
+    def _keras_predict(self, model):
+        def predict(x):
+            with self.keras_graph.as_default():
+                return model.predict(x, batch_size=len(x), verbose=0).reshape(-1)
+        return predict
+
+    @staticmethod
+    def _lstm_predict(lstm):
+        def predict(x):
+            # probability of the first class (positive) from the two logits
+            logits = lstm.predict_logits(x, batch_size=len(x))
+            logits = logits - logits.max(axis=1, keepdims=True)
+            return np.exp(logits[:, 0]) / np.exp(logits).sum(axis=1)
+        return predict
+
+    def predict_models(self, ids):
+        """probabilities of being positive of every row of ids (one column per model)"""
+        probabilities = np.empty((len(ids), len(self.models)), dtype='float32')
+        for start in range(0, len(ids), self.batch_size):
+            batch = np.asarray(ids[start:start+self.batch_size])
+            # the word vectors of the batch are looked up once, for all the models
+            embedded = None
+            if any(embedded_input for _, _, embedded_input in self.models):
+                embedded = np.asarray(self.word_vectors[batch], dtype='float32')
+            futures = [self.pool.submit(predict, embedded if embedded_input else batch)
+                       for _, predict, embedded_input in self.models]
+            for i, future in enumerate(futures):
+                probabilities[start:start+len(batch), i] = future.result()
+        return probabilities
+
+    def _predict_model(self, ids):
+        probabilities = self.predict_models(ids)
+        if self.combine == 'vote':
+            return (probabilities >= 0.5).mean(axis=1)
+        return probabilities.mean(axis=1)
+
+    def close(self):
+        self.pool.shutdown()
+        if self.lstm is not None:
+            self.lstm.close()
+
+
+if __name__ == '__main__':
+
+    wordVectors = load_embeddings(word_vecs_path)
+    ids_test = np.load(ids_test_path, mmap_mode='r')
+
+    predictor = EnsemblePredictor(wordVectors, keras_models, lstm_checkpoint_dir, combine=combine)
+    predictor.predict_to_submission(ids_test, 'ensemble_prediction.csv')
+    predictor.close()
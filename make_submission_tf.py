@@ -1,6 +1,8 @@
 """
 make_submission_tf.py: Run this script to get a prediction
-after having trained a model done with tensorflow
+after having trained a model done with tensorflow. The inference
+itself is done by the LSTMPredictor of 'tf_lstm.py', that can also
+be imported and called repeatedly without rebuilding the graph
 """
 
 __author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
@@ -10,89 +12,32 @@ __license__   = "MIT"
 __version_    = "1.0.1"
 __status__    = "Project"
 
-from helpers import *
-import tensorflow as tf
+from tf_lstm import *
 
 
-wordVectors = np.load('data/our_trained_wordvectors/wordvecs_sg_6.npy')
-print('Loaded the word vectors!')
+saved_model_dir = 'data/models/lstm_saved_model'
+# True if the LSTM was trained with use_sequence_length ('LSTM_kaggle_score_0.85620.py'):
+# the LSTM then stops at the last token of every tweet, as in training
+use_sequence_length = False
 
-path_test = "data/twitter-datasets/test_data.txt"
-test_files = []
+# the lengths of the tweets are saved in the header of the ids matrix
+ids_test, _, lengths_test = load_ids_dataset('data/our_trained_wordvectors/ids_test_sg_6.npy')
 
-with open(path_test, "r") as f:
-    for line in f:
-        test_files.append(line)
+if os.path.exists(saved_model_dir):
+    # float32 inference graph exported by 'export_tf_lstm.py'
+    predictor = LSTMPredictor.from_saved_model(saved_model_dir, cache_size=100000)
+else:
+    wordVectors = load_embeddings('data/our_trained_wordvectors/wordvecs_sg_6.npy')
+    print('Loaded the word vectors!')
 
-ids_test = np.load('data/our_trained_wordvectors/ids_test_sg_6.npy')
+    # the graph is built and the checkpoint restored only once
+    predictor = LSTMPredictor(wordVectors, checkpoint_dir='data/models', cache_size=100000,
+                              use_sequence_length=use_sequence_length)
 
-
-batch_size = 100
-lstm_units = 128
-num_classes = 2
-iterations = 100000
-max_seq_length = 20
-num_dimensions = 300  # Dimensions for each word vector # 300 lui mette 300, ma da dove gli esce fuori??
-
-tf.reset_default_graph()
-
-labels = tf.placeholder(tf.float32, [batch_size, num_classes])  # a place in memory where we will store value later on.
-input_data = tf.placeholder(tf.int32, [batch_size, max_seq_length])
-
-data = tf.Variable(tf.zeros([batch_size, max_seq_length, num_dimensions]), dtype=tf.float32)  # Is it useful?
-# An embedding is a mapping from discrete objects, such as words, to vectors of real numbers.
-data = tf.nn.embedding_lookup(wordVectors, input_data)
-
-
-lstmCell = tf.nn.rnn_cell.BasicLSTMCell(lstm_units)
-# We’ll then wrap that LSTM cell in a dropout layer to help prevent the network from overfitting
-lstmCell = tf.nn.rnn_cell.DropoutWrapper(cell=lstmCell, output_keep_prob=0.85)
-
-# Creates a recurrent neural network specified by RNNCell cell. data is the input
-# (outputs) value contains the output of the RNN cell at every time instant.
-#  - https://stackoverflow.com/questions/44162432/analysis-of-the-output-from-tf-nn-dynamic-rnn-tensorflow-function
-# _ it's the final state
-value, _ = tf.nn.dynamic_rnn(lstmCell, data, dtype=tf.float64)
-
-# tf.truncated_normal: outputs random values from a truncated normal distribution.
-weight = tf.Variable(tf.truncated_normal([lstm_units, num_classes]))
-bias = tf.Variable(tf.constant(0.1, shape=[num_classes]))
-value = tf.transpose(value, [1, 0, 2])  # understand why the transpose and not value[:, -1, :] = last output of the cell
-
-# https://www.tensorflow.org/versions/master/api_docs/python/tf/gather
-last = tf.gather(value, int(value.get_shape()[0]) - 1)
-last = tf.cast(last, tf.float32)
-prediction = (tf.matmul(last, weight) + bias)  # matrix product
-
-# argmax(input, axis=None, name=None, dimension=None, output_type=tf.int64)
-correctPred = tf.equal(tf.argmax(prediction, 1), tf.argmax(labels, 1))
-# reduce_mean: computes the mean of elements across dimensions of a tensor.
-accuracy = tf.reduce_mean(tf.cast(correctPred, tf.float32))
-
-sess = tf.InteractiveSession()
-saver = tf.train.Saver()
-saver.restore(sess, tf.train.latest_checkpoint('data/models'))
-
-predictions = []
-for i in range(0, len(test_files), batch_size):
-    if i+batch_size < len(test_files):
-        test_batch = ids_test[i:i+batch_size]
-        pred = sess.run([prediction], {input_data: test_batch})
-
-    else:
-        test_batch = ids_test[i:len(test_files)]
-        missed_words = i + batch_size - len(test_files)
-
-        for i in range(missed_words):
-            test_batch = np.vstack((test_batch, np.array([0]*max_seq_length)))
-
-        pred = sess.run([prediction], {input_data: test_batch})
-
-        pred[0] = pred[0][0:len(pred[0]) - missed_words]
-
-    if i == 0:
-        predictions = pred[0]
-    else:
-        predictions = np.vstack((predictions, pred[0]))
+# all the tweets are predicted, the last batch is smaller if needed
+# the identical tweets (e.g. retweets) are predicted only once
+predictions = predictor.predict_logits(ids_test, batch_size=100, lengths=lengths_test)
+print('Prediction cache: ', predictor.cache.stats())
+predictor.close()
 
 make_submission(predictions, 'LSTM_prediction', from_tf=True)
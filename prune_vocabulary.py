@@ -0,0 +1,31 @@
+"""
+prune_vocabulary.py: This script shrinks the vocabulary of our word vectors to the
+words that really appear in the ids matrices of the train and test data (or to the
+top_n most frequent ones), and remaps consistently both ids matrices. It saves the
+pruned word list, word vectors and ids matrices next to the original ones, with the
+'_pruned' suffix: the Embedding layer of 'run.py' becomes much smaller, and so the
+time and the memory of every step of the optimizer when the word vectors are trained.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+from helpers import *
+
+
+word_list_path = 'data/our_trained_wordvectors/word_list_sg_6.npy'
+word_vecs_path = 'data/our_trained_wordvectors/wordvecs_sg_6.npy'
+ids_paths = ['data/our_trained_wordvectors/ids_sg_6.npy', 'data/our_trained_wordvectors/ids_test_sg_6.npy']
+
+# None keeps all the words of the ids matrices, otherwise only the top_n most frequent ones
+top_n = None
+
+num_words = len(np.load(word_list_path, mmap_mode='r'))
+kept = prune_embeddings(word_list_path, word_vecs_path, ids_paths, top_n=top_n)
+
+print('The number of words before the pruning is', num_words)
+print('The number of words after the pruning is', len(kept))
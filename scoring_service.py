@@ -0,0 +1,261 @@
+"""
+scoring_service.py: This file contains a local HTTP service that scores the sentiment
+of tweets in real time with our best CNN_LSTM model (the one of 'run.py'). The model
+and the vocabulary are loaded once; every tweet is cleaned and converted to ids when
+its request arrives, and the tweets of concurrent requests are grouped in micro-batches
+(at most max_batch_size tweets, waiting at most max_latency_ms for other tweets) that
+are predicted by a single thread. Run this script to start the service, then:
+
+curl -X POST -d '{"texts": ["i love this", "i hate mondays"]}' http://localhost:8000/predict
+curl http://localhost:8000/metrics
+
+/predict returns the labels (1 positive, -1 negative) and the probabilities of being
+positive of the tweets, /metrics the number of requests, the p50 and p99 latency and the
+throughput of the service, the mean size of the micro-batches and the counters of the
+cache of the predictions (the same tweet is predicted only once, see PredictionCache).
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import collections
+import json
+import queue
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import tensorflow as tf
+from helpers import *
+
+
+model_path = 'data/kaggle_score_0.8594/kaggle_score_0.8594_model.json'
+weights_path = 'data/kaggle_score_0.8594/kaggle_score_0.8594__weights.h5'
+words_list_path = 'data/our_trained_wordvectors/word_list_sg_6.npy'
+host = 'localhost'
+port = 8000
+
+# micro-batches: the latency budget is the time the first tweet of a batch waits for other tweets
+max_batch_size = 64
+max_latency_ms = 5
+
+
+class LatencyStats(object):
+    """
+    thread-safe statistics of the requests of the service: latencies of the
+    last window requests, total number of requests and of micro-batches
+    """
+
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.latencies = collections.deque(maxlen=window)
+        self.start_time = time.time()
+        self.num_requests = 0
+        self.num_tweets = 0
+        self.num_batches = 0
+
+    def add_request(self, latency, num_tweets):
+        with self.lock:
+            self.latencies.append(latency)
+            self.num_requests += 1
+            self.num_tweets += num_tweets
+
+    def add_batch(self):
+        with self.lock:
+            self.num_batches += 1
+
+    def summary(self):
+        """p50 and p99 latency (ms) of the last requests, throughput and mean size of the micro-batches"""
+        with self.lock:
+            latencies = np.array(self.latencies)
+            elapsed = time.time() - self.start_time
+            return {
+                'requests': self.num_requests,
+                'tweets': self.num_tweets,
+                'p50_ms': 1000 * float(np.percentile(latencies, 50)) if len(latencies) else None,
+                'p99_ms': 1000 * float(np.percentile(latencies, 99)) if len(latencies) else None,
+                'requests_per_second': self.num_requests / elapsed,
+                'tweets_per_second': self.num_tweets / elapsed,
+                'mean_batch_size': self.num_tweets / float(self.num_batches) if self.num_batches else None,
+            }
+
+
+class MicroBatcher(object):
+    """
+    groups the rows submitted by many threads in batches predicted by a
+    single worker thread. A batch is predicted when it has max_batch_size
+    rows, or max_latency seconds after its first row arrived.
+    submit returns a Future with the prediction of the row.
+    """
+
+    def __init__(self, predict, max_batch_size=64, max_latency=0.005, stats=None):
+        """
+        :param predict: function that predicts a matrix of rows, one result per row
+        :param max_batch_size: maximum number of rows of a batch
+        :param max_latency: maximum time (seconds) the first row of a batch waits for other rows
+        :param stats: optional LatencyStats, to count the batches
+        """
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.stats = stats
+        self.queue = queue.Queue()
+
+        self.worker = threading.Thread(target=self._run)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def submit(self, row):
+        future = Future()
+        self.queue.put((row, future))
+        return future
+
+    def _next_batch(self):
+        """waits for a row, then collects rows until the batch is full or the latency budget is over"""
+        batch = [self.queue.get()]
+        deadline = time.time() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            futures = [future for _, future in batch]
+            try:
+                results = self.predict(np.array([row for row, _ in batch]))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, result in zip(futures, results):
+                future.set_result(result)
+            if self.stats is not None:
+                self.stats.add_batch()
+
+
+class SentimentScorer(object):
+    """
+    scores raw tweets with a Keras model: every tweet is cleaned and converted
+    to a row of ids as in the ids matrices, and the rows are predicted in
+    micro-batches (see MicroBatcher)
+    """
+
+    def __init__(self, model_path, weights_path, vocabulary, max_seq_length=20, max_batch_size=64,
+                 max_latency=0.005, cache_size=100000):
+        # the cache is used only by the thread of the batcher
+        self.predictor = Predictor(model_path, weights_path, batch_size=max_batch_size, cache_size=cache_size)
+        self.vocabulary = vocabulary
+        self.max_seq_length = max_seq_length
+
+        # the predictions are run by the thread of the batcher: the predict function is built
+        # here, and the thread uses the graph of the model
+        self.predictor.model._make_predict_function()
+        self.graph = tf.get_default_graph()
+
+        self.stats = LatencyStats()
+        self.batcher = MicroBatcher(self._predict_batch, max_batch_size, max_latency, self.stats)
+
+    def _predict_batch(self, ids):
+        with self.graph.as_default():
+            return self.predictor.predict_proba(ids)
+
+    def to_ids(self, text):
+        """row of ids of a raw tweet"""
+        row = np.zeros(self.max_seq_length, dtype='int32')
+        ids = self.vocabulary.sentence_to_ids(clean_sentences(text), self.max_seq_length)
+        row[:len(ids)] = ids
+        return row
+
+    def score(self, texts):
+        """labels (1 / -1) and probabilities of being positive of a list of raw tweets"""
+        start = time.time()
+        futures = [self.batcher.submit(self.to_ids(text)) for text in texts]
+        probabilities = [float(future.result()) for future in futures]
+        labels = [1 if probability >= 0.5 else -1 for probability in probabilities]
+        self.stats.add_request(time.time() - start, len(texts))
+        return labels, probabilities
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """HTTP server with a thread per request"""
+    daemon_threads = True
+    # many clients can connect at the same time (the default queue has only 5 connections)
+    request_queue_size = 128
+
+
+def make_handler(scorer):
+    """request handler of the service, using the scorer"""
+
+    class ScoringHandler(BaseHTTPRequestHandler):
+
+        def _send_json(self, status, content):
+            body = json.dumps(content).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/metrics':
+                metrics = scorer.stats.summary()
+                if scorer.predictor.cache is not None:
+                    metrics['cache'] = scorer.predictor.cache.stats()
+                self._send_json(200, metrics)
+            elif self.path == '/health':
+                self._send_json(200, {'status': 'ok'})
+            else:
+                self._send_json(404, {'error': 'unknown path ' + self.path})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self._send_json(404, {'error': 'unknown path ' + self.path})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+                texts = request['texts'] if 'texts' in request else [request['text']]
+                if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                    raise TypeError
+            except (ValueError, KeyError, TypeError):
+                self._send_json(400, {'error': 'the body must be {"text": "..."} or {"texts": ["...", ...]}'})
+                return
+
+            try:
+                labels, probabilities = scorer.score(texts)
+            except Exception as e:
+                # the error of the prediction of the batch, raised by the futures of its rows
+                self._send_json(500, {'error': 'the prediction failed: %s' % e})
+                return
+            self._send_json(200, {'labels': labels, 'probabilities': probabilities})
+
+        def log_message(self, format, *args):
+            # no line printed for every request
+            pass
+
+    return ScoringHandler
+
+
+if __name__ == '__main__':
+
+    scorer = SentimentScorer(model_path, weights_path, Vocabulary.from_npy(words_list_path),
+                             max_batch_size=max_batch_size, max_latency=max_latency_ms / 1000.)
+
+    server = ThreadingHTTPServer((host, port), make_handler(scorer))
+    print('Scoring service listening on http://%s:%d' % (host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
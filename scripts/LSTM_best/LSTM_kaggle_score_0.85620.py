@@ -11,8 +11,7 @@ __license__   = "MIT"
 __version_    = "1.0.1"
 __status__    = "Project"
 
-import tensorflow as tf
-from helpers import *
+from tf_lstm import *
 import datetime
 
 
@@ -20,12 +19,12 @@ import datetime
 Loading pre-trained wordvectors and wordsList
 '''
 
-wordVectors = np.load('../../data/our_trained_wordvectors/wordvecs_sg_6.npy')
+wordVectors = load_embeddings('../../data/our_trained_wordvectors/wordvecs_sg_6.npy')
 
 '''
-Now, let's load our ids matrix
+Now, let's load our ids matrix (memory-mapped, the rows are read from disk only when they are used)
 '''
-ids = np.load('../../data/our_trained_wordvectors/ids_sg_6.npy')
+ids, labels_ids, lengths = load_ids_dataset('../../data/our_trained_wordvectors/ids_sg_6.npy')
 max_seq_length = ids.shape[1]
 
 '''
@@ -54,13 +53,34 @@ lstm_units = 128
 num_classes = 2
 epochs = 4
 
+# If True, the batches group tweets of similar length (saved in the header of the ids matrix) and the LSTM stops at the
+# last word of every tweet instead of running over the padding zeros, which are also the id of a real word.
+# Faster on CPU, but the model is not the one of our Kaggle score, that was trained with the padding.
+use_sequence_length = False
+
 # Dimensions for each word vector
 num_dimensions = wordVectors.shape[1]
 
 tf.reset_default_graph()
 
-labels = tf.placeholder(tf.float32, [batch_size, num_classes])  # a place in memory where we will store value later on.
-input_data = tf.placeholder(tf.int32, [batch_size, max_seq_length])
+'''
+The batches of tweets and labels come from a tf.data pipeline: the train set is shuffled at every epoch, and the 
+batches are read from the memory-mapped ids matrix by a background thread and prefetched while the optimizer runs.
+The evaluation on the test set feeds its batches directly to input_data.
+'''
+x_tr, x_te, y_tr, y_te = split_data_tf(ids, 0.9, labels=labels_ids, lazy=True)
+
+if use_sequence_length:
+    # number of words of the tweets of the train and test sets, at least 1
+    lengths_tr = RowView(lengths, x_tr.indices)
+    lengths_te = np.maximum(RowView(lengths, x_te.indices)[:], 1)
+
+    train_dataset, steps_per_epoch = make_train_dataset(x_tr, y_tr, batch_size, epochs, lengths=lengths_tr)
+    input_data, labels, sequence_length = train_dataset.make_one_shot_iterator().get_next()
+else:
+    train_dataset, steps_per_epoch = make_train_dataset(x_tr, y_tr, batch_size, epochs)
+    input_data, labels = train_dataset.make_one_shot_iterator().get_next()
+    sequence_length = None
 
 '''
 Once we have our input data placeholder, we’re going to call the tf.nn.embedding_lookup() function in order to get our 
@@ -92,7 +112,9 @@ lstmCell = tf.nn.rnn_cell.DropoutWrapper(cell=lstmCell, output_keep_prob=0.85)
 # Creates a recurrent neural network specified by RNNCell cell. data is the input
 # (outputs) value contains the output of the RNN cell at every time instant.
 # _ it's the final state
-value, _ = tf.nn.dynamic_rnn(lstmCell, data, dtype=tf.float64)
+# With sequence_length, dynamic_rnn stops at the longest tweet of the batch
+# The LSTM runs in the precision of the word vectors (float32, our first checkpoints were in float64)
+value, _ = tf.nn.dynamic_rnn(lstmCell, data, dtype=data.dtype, sequence_length=sequence_length)
 
 '''
 The first output of the dynamic RNN function can be thought of as the last hidden state vector. This vector will be 
@@ -102,9 +124,12 @@ reshaped and then multiplied by a final weight matrix and a bias term to obtain
 weight = tf.Variable(tf.truncated_normal([lstm_units, num_classes]))
 bias = tf.Variable(tf.constant(0.1, shape=[num_classes]))
 
-# last output of the cell
-value = tf.transpose(value, [1, 0, 2])
-last = tf.gather(value, int(value.get_shape()[0]) - 1)
+# last output of the cell (at the last word of every tweet with sequence_length)
+if use_sequence_length:
+    last = last_relevant_output(value, sequence_length)
+else:
+    value = tf.transpose(value, [1, 0, 2])
+    last = tf.gather(value, int(value.get_shape()[0]) - 1)
 
 last = tf.cast(last, tf.float32)
 prediction = (tf.matmul(last, weight) + bias)  # matrix product
@@ -179,30 +204,28 @@ for epoch in range(0, epochs):
     #     saver = tf.train.Saver()
     #     saver.restore(sess, tf.train.latest_checkpoint('models_new'))
 
-    x_tr, x_te, y_tr, y_te = split_data_tf(ids, 0.9)
+    for step in range(steps_per_epoch):
 
-    for i in range((len(x_tr)-batch_size) * epoch, (len(x_tr)-batch_size)*(epoch+1), batch_size):
+        # number of tweets seen since the beginning of the training
+        i = (epoch * steps_per_epoch + step) * batch_size
 
-        index = i - (len(x_tr)-batch_size) * epoch
+        if step % 500 == 0:
+            print('Iteration number: ', epoch * steps_per_epoch + step)
+            print('Step to the end: ', steps_per_epoch - step)
 
-        if i/batch_size % 500 == 0:
-            print('Iteration number: ', i/batch_size * (epoch+1))
-            print('Step to the end: ', (len(x_tr) - i*(epoch+1))/batch_size)
+        # Next Batch of tweets comes from the input pipeline. Every 50 steps the summary is
+        # fetched in the same run of the optimizer, without a second forward pass
+        if step % 50 == 0:
+            _, summary = sess.run([optimizer, merged])
 
-        # Next Batch of tweets
-        nextBatch = x_tr[index:index+batch_size]
-        nextBatchLabels = y_tr[index:index+batch_size]
-
-        sess.run(optimizer, {input_data: nextBatch, labels: nextBatchLabels})
-
-        # Write summary to Tensorboard
-        if i/batch_size % 50 == 0:
-            summary = sess.run(merged, {input_data: nextBatch, labels: nextBatchLabels})
+            # Write summary to Tensorboard
             writer.add_summary(summary, i)
             writer.flush()
+        else:
+            sess.run(optimizer)
 
-        # Save the network every 10,000 training iterations
-        if i % 10000 == 0 and i != 0:
+        # Save the network every 100 training iterations
+        if step % 100 == 0 and i != 0:
             save_path = saver.save(sess, "../../data/models/pretrained_lstm.ckpt", global_step=i)
             print("saved to %s" % save_path)
 
@@ -214,7 +237,10 @@ for epoch in range(0, epochs):
         if t/batch_size % 10 == 0:
             print('Iteration number: ', t/batch_size, ' tot_iter = ', len(y_te)/batch_size)
         test_batch = x_te[t:t+batch_size]
-        pred = sess.run([prediction], {input_data: test_batch})
+        if use_sequence_length:
+            pred = sess.run([prediction], {input_data: test_batch, sequence_length: lengths_te[t:t+batch_size]})
+        else:
+            pred = sess.run([prediction], {input_data: test_batch})
         if t == 0:
             predictions = pred[0]
         else:
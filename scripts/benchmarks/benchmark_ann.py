@@ -0,0 +1,53 @@
+"""
+benchmark_ann.py: This script builds the IVFIndex over our word vectors and
+reports, for different numbers of probes, the recall@k against the exact
+neighbours of the SimilarityEngine and the queries/second of both.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import time
+from helpers import *
+
+
+word_vecs_path = '../../data/our_trained_wordvectors/wordvecs_sg_6.npy'
+top_k = 10
+num_queries = 1000
+probes_list = [1, 2, 4, 8, 16, 32, 64]
+
+
+word_vecs = np.load(word_vecs_path, mmap_mode='r')[:-1]  # without the UNK vector
+queries = np.random.RandomState(1).choice(len(word_vecs), num_queries, replace=False)
+
+start = time.time()
+index = IVFIndex(word_vecs)
+print('Index with %d lists built in %.1f s' % (len(index.centroids), time.time() - start))
+
+engine = SimilarityEngine(word_vecs)
+start = time.time()
+exact = np.concatenate([engine.top_k(queries[i:i+100], top_k)[0] for i in range(0, num_queries, 100)])
+exact_qps = num_queries / (time.time() - start)
+
+print('%-8s %10s %14s' % ('probes', 'recall@%d' % top_k, 'queries/second'))
+print('%-8s %10.3f %14.0f' % ('exact', 1., exact_qps))
+for num_probes in probes_list:
+    start = time.time()
+    approximate, _ = index.top_k(queries, top_k, num_probes=num_probes)
+    qps = num_queries / (time.time() - start)
+
+    recall = np.mean([len(set(a) & set(b)) / float(top_k) for a, b in zip(exact, approximate)])
+    print('%-8d %10.3f %14.0f' % (num_probes, recall, qps))
+
+# with small lists, a query may find fewer than top_k + 1 candidates: the query word itself
+# must never be returned, the missing neighbours are padded with -1
+small_index = IVFIndex(word_vecs[:100], num_lists=50)
+small_queries = np.arange(100)
+neighbours, similarities = small_index.top_k(small_queries, top_k, num_probes=1)
+assert not (neighbours == small_queries[:, None]).any()
+assert np.array_equal(neighbours == -1, np.isinf(similarities))
+print('Padding of the queries with few candidates: OK (%d rows padded)' % (neighbours == -1).any(axis=1).sum())
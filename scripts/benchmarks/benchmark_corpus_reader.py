@@ -0,0 +1,49 @@
+"""
+benchmark_corpus_reader.py: This script measures the number of sentences per
+second given to gensim by MySentences (one thread reading and cleaning the
+tweets) and by ParallelSentences (chunks of the files cleaned by a pool of
+processes) for different numbers of workers, checking that the sentences are
+the same and in the same order.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import time
+from helpers import *
+
+
+sentences_dir = '../../data/combined_tweets'
+
+
+if __name__ == '__main__':
+
+    start = time.time()
+    num_sentences = 0
+    for sentence in MySentences(sentences_dir):
+        num_sentences += 1
+    serial_time = time.time() - start
+
+    results = [('MySentences', serial_time)]
+
+    num_workers = 1
+    while num_workers <= multiprocessing.cpu_count():
+        start = time.time()
+        count = 0
+        for sentence in ParallelSentences(sentences_dir, num_workers=num_workers):
+            count += 1
+        elapsed = time.time() - start
+
+        assert count == num_sentences
+        results.append((str(num_workers) + ' workers', elapsed))
+        num_workers *= 2
+
+    assert all(a == b for a, b in zip(MySentences(sentences_dir), ParallelSentences(sentences_dir)))
+
+    print('%-12s %12s %18s %10s' % ('reader', 'time (s)', 'sentences/second', 'speed up'))
+    for version, elapsed in results:
+        print('%-12s %12.1f %18.0f %9.1fx' % (version, elapsed, num_sentences / elapsed, serial_time / elapsed))
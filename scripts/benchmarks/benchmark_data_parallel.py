@@ -0,0 +1,75 @@
+"""
+benchmark_data_parallel.py: This script measures the scaling of the data-parallel training
+of 'keras_data_parallel.py' with the two kernels CNN_LSTM of 'run.py': for 1 to the number
+of cores processes, it trains the same model (same initial weights) for one epoch on a part
+of the train set, and reports the time of the epoch, the number of tweets per second, the
+speed up and the efficiency with respect to one process, and the validation accuracy.
+The validation accuracy must be about the same for every number of processes, since the
+batches and the updates are the same.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import time
+from keras import Sequential
+from keras.layers import Embedding, Dropout, LSTM, Dense
+from keras_data_parallel import *
+
+
+word_vecs_path = '../../data/our_trained_wordvectors/wordvecs_sg_6.npy'
+ids_path = '../../data/our_trained_wordvectors/ids_sg_6.npy'
+num_rows = 20000
+batch_size = 100
+# the Embedding layer of run.py is trainable: True also measures the all-gather of its rows
+trainable = False
+workers_list = [n for n in (1, 2, 4, 8, 16, 32) if n <= multiprocessing.cpu_count()]
+
+
+def build_model(word_vectors, max_seq_length):
+    """the architecture of 'run.py'"""
+    model = Sequential()
+    model.add(Embedding(word_vectors.shape[0], word_vectors.shape[1], input_length=max_seq_length,
+                        weights=[word_vectors], trainable=trainable))
+    model.add(Dropout(0.2))
+    model.add(conv_different_kernels(128, [2, 4], max_sentence_length=max_seq_length,
+                                     input_dim=(max_seq_length, word_vectors.shape[1])))
+    model.add(Dropout(0.2))
+    model.add(LSTM(256))
+    model.add(Dense(1, activation='sigmoid'))
+    model.compile(loss='binary_crossentropy', optimizer=keras.optimizers.Adam(lr=0.001), metrics=['accuracy'])
+    return model
+
+
+wordVectors = load_embeddings(word_vecs_path)
+ids, labels, lengths = load_ids_dataset(ids_path)
+if labels is None:
+    labels = np.array([1] * int(len(ids)/2) + [0] * int(len(ids)/2))
+
+# a random part of the rows, as views of the memory-mapped ids matrix (the processes do not copy it)
+rows = np.random.RandomState(1).choice(len(ids), num_rows, replace=False)
+split = int(0.9 * num_rows)
+x_train, x_test = RowView(ids, rows[:split]), RowView(ids, rows[split:])
+y_train, y_test = labels[rows[:split]], labels[rows[split:]]
+
+model = build_model(wordVectors, ids.shape[1])
+initial_weights = model.get_weights()
+
+results = []
+for num_workers in workers_list:
+    model.set_weights(initial_weights)
+    history = History()
+    start = time.time()
+    fit_data_parallel(model, x_train, y_train, x_test, y_test, batch_size, 1, num_workers, history=history)
+    results.append((num_workers, time.time() - start, history.epocs_val_acc[-1]))
+
+print('%-8s %10s %16s %10s %12s %10s' % ('workers', 'epoch (s)', 'tweets/second', 'speed up', 'efficiency',
+                                         'val acc'))
+for num_workers, epoch_time, val_acc in results:
+    speed_up = results[0][1] / epoch_time
+    print('%-8d %10.1f %16.0f %9.2fx %12.2f %10.4f' % (num_workers, epoch_time, len(x_train) / epoch_time,
+                                                        speed_up, speed_up / num_workers, val_acc))
@@ -0,0 +1,63 @@
+"""
+benchmark_embeddings.py: This script compares the variants of our word vectors
+saved by 'skipgram_gensim.py' (float32, float16 and int8 with a scale per row):
+size of the file, memory and time needed to load them, latency of the lookup of
+a batch of tweets, and accuracy with respect to the float32 vectors (largest
+error, cosine similarity of the vectors and overlap of the nearest neighbours).
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import time
+from helpers import *
+
+
+word_vecs_path = '../../data/our_trained_wordvectors/wordvecs_sg_6.npy'
+ids_path = '../../data/our_trained_wordvectors/ids_sg_6.npy'
+batch_size = 100
+repetitions = 100
+top_k = 10
+num_queries = 200
+
+
+reference = load_embeddings(word_vecs_path, mmap_mode=None)
+ids = np.load(ids_path, mmap_mode='r')
+batches = [np.asarray(ids[i*batch_size:(i+1)*batch_size]) for i in range(repetitions)]
+queries = np.random.RandomState(1).choice(len(reference) - 1, num_queries, replace=False)
+reference_neighbours, _ = SimilarityEngine(reference[:-1]).top_k(queries, top_k)
+
+print('%-8s %10s %12s %10s %14s %10s %10s %10s' % ('dtype', 'file (MB)', 'memory (MB)', 'load (s)',
+                                                   'lookup (ms)', 'max error', 'cosine', 'overlap'))
+
+for dtype in ('float32', 'float16', 'int8'):
+    path = word_vecs_path if dtype == 'float32' else embeddings_path(word_vecs_path, dtype)
+    file_size = os.path.getsize(path)
+    if dtype == 'int8':
+        file_size += os.path.getsize(embeddings_scale_path(path))
+
+    # the vectors are loaded in memory in their own dtype (the int8 ones need their scales, so in float32)
+    start = time.time()
+    word_vecs = load_embeddings(path, dtype='float32' if dtype == 'int8' else dtype, mmap_mode=None)
+    load_time = time.time() - start
+
+    # lookup of the vectors of batches of tweets, as the Embedding layer does
+    start = time.time()
+    for batch in batches:
+        word_vecs[batch].astype('float32')
+    lookup_time = 1000 * (time.time() - start) / repetitions
+
+    vectors = np.asarray(word_vecs, dtype='float32')
+    max_error = np.abs(vectors - reference).max()
+    cosine = np.mean(np.sum(vectors * reference, axis=1)
+                     / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1)))
+    neighbours, _ = SimilarityEngine(vectors[:-1]).top_k(queries, top_k)
+    overlap = np.mean([len(set(a) & set(b)) / float(top_k) for a, b in zip(reference_neighbours, neighbours)])
+
+    print('%-8s %10.1f %12.1f %10.2f %14.3f %10.4f %10.5f %10.3f'
+          % (dtype, file_size / 2.**20, word_vecs.nbytes / 2.**20, load_time, lookup_time,
+             max_error, cosine, overlap))
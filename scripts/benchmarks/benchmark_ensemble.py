@@ -0,0 +1,80 @@
+"""
+benchmark_ensemble.py: This script compares the prediction of the test set with our
+three models one after the other (each one in its own process, loaded with its own
+copy of the word vectors, as in their scripts) with the EnsemblePredictor of
+'make_submission_ensemble.py' (one process, word vectors shared and models run at the
+same time on a pool of threads): time needed to load the models and to predict, and
+largest memory used. The time of the models one after the other is the sum of their
+processes, the memory is the largest one of their processes.
+It also checks that the ensemble gives the same predictions of the three models.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import resource
+import time
+from make_submission_ensemble import *
+
+
+word_vecs_path = '../../data/our_trained_wordvectors/wordvecs_sg_6.npy'
+ids_test_path = '../../data/our_trained_wordvectors/ids_test_sg_6.npy'
+keras_models = [('../../' + model_path, '../../' + weights_path) for model_path, weights_path in keras_models]
+lstm_checkpoint_dir = '../../data/models'
+num_rows = 10000
+
+
+def peak_memory():
+    """largest memory (MB) used by the process until now (Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2.**10
+
+
+def run_version(name):
+    """
+    loads the model (or the ensemble) and predicts num_rows rows of the test set,
+    in a new process (so that the memory of the process is the one of this version only)
+    :param name: 'ensemble', 'lstm' or the index of the Keras model in keras_models
+    """
+    start = time.time()
+    wordVectors = load_embeddings(word_vecs_path)
+    ids_test = np.asarray(np.load(ids_test_path, mmap_mode='r')[:num_rows])
+
+    if name == 'ensemble':
+        ensemble = EnsemblePredictor(wordVectors, keras_models, lstm_checkpoint_dir)
+        predictions = ensemble.predict_models(ids_test)
+        ensemble.close()
+    elif name == 'lstm':
+        lstm = LSTMPredictor(wordVectors, lstm_checkpoint_dir)
+        predictions = EnsemblePredictor._lstm_predict(lstm)(ids_test)
+        lstm.close()
+    else:
+        # a Keras model with its own word vectors
+        predictions = Predictor(*keras_models[name]).predict_proba(ids_test)
+    return time.time() - start, peak_memory(), predictions
+
+
+def run_in_process(name):
+    """runs run_version in a new process"""
+    pool = multiprocessing.Pool(1)
+    result = pool.apply(run_version, (name,))
+    pool.close()
+    pool.join()
+    return result
+
+
+if __name__ == '__main__':
+
+    # the models one after the other, each one in its own process
+    models = [run_in_process(name) for name in list(range(len(keras_models))) + ['lstm']]
+    results = [('one after the other', sum(elapsed for elapsed, _, _ in models),
+                max(memory for _, memory, _ in models), np.stack([p for _, _, p in models], axis=1))]
+    results.append(('ensemble',) + run_in_process('ensemble'))
+
+    print('Largest difference of the predictions: ', np.abs(results[0][3] - results[1][3]).max())
+    print('%-22s %10s %18s' % ('version', 'time (s)', 'peak memory (MB)'))
+    for name, elapsed, memory, _ in results:
+        print('%-22s %10.2f %18.0f' % (name, elapsed, memory))
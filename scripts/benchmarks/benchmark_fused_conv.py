@@ -0,0 +1,66 @@
+"""
+benchmark_fused_conv.py: This script compares, on CPU, the convolutional layer
+with two kernel sizes of 'run.py' (conv_different_kernels, one convolution per
+kernel size) with its fused version (conv_different_kernels_fused, a single
+convolution), with the same weights: it checks that the outputs are the same and
+measures the time of the prediction of batches of embedded tweets. Then, if the
+model of 'run.py' has been saved, it does the same with the whole model loaded
+from run_model.json and run_weights.h5.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import time
+from helpers import *
+
+
+model_path = '../best_score_two_kernels_CNN_LSTM/run_model.json'
+weights_path = '../best_score_two_kernels_CNN_LSTM/run_weights.h5'
+ids_test_path = '../../data/our_trained_wordvectors/ids_test_sg_6.npy'
+kernel_sizes = [2, 4]
+num_filters = 128
+max_seq_length = 20
+embedding_size = 300
+batch_size = 100
+repetitions = 20
+
+
+def timed_predict(model, x):
+    """seconds per batch of the prediction of x, after a first prediction not measured"""
+    model.predict(x[:batch_size], batch_size=batch_size)
+    start = time.time()
+    for _ in range(repetitions):
+        output = model.predict(x, batch_size=batch_size)
+    return (time.time() - start) / repetitions / (len(x) / batch_size), output
+
+
+branched = conv_different_kernels(num_filters, kernel_sizes, max_seq_length, (max_seq_length, embedding_size))
+fused = conv_different_kernels_fused(num_filters, kernel_sizes, max_seq_length, (max_seq_length, embedding_size))
+conv_layers = [layer for layer in branched.layers if isinstance(layer, Conv1D)]
+fused.set_weights(fused_conv_weights([conv.get_weights() for conv in conv_layers], kernel_sizes))
+
+x = np.random.RandomState(1).randn(10 * batch_size, max_seq_length, embedding_size).astype('float32')
+branched_time, branched_output = timed_predict(branched, x)
+fused_time, fused_output = timed_predict(fused, x)
+
+print('Largest difference of the outputs of the layers: ', np.abs(branched_output - fused_output).max())
+print('%-22s %14s %10s' % ('version', 'batch (ms)', 'speed up'))
+print('%-22s %14.2f' % ('conv layer, branched', 1000 * branched_time))
+print('%-22s %14.2f %9.2fx' % ('conv layer, fused', 1000 * fused_time, branched_time / fused_time))
+
+if os.path.exists(model_path) and os.path.exists(weights_path):
+    ids_test = np.load(ids_test_path, mmap_mode='r')[:10 * batch_size]
+
+    model = Predictor(model_path, weights_path).model
+    fused_model = fuse_conv_blocks(model)
+    model_time, model_output = timed_predict(model, ids_test)
+    fused_model_time, fused_model_output = timed_predict(fused_model, ids_test)
+
+    print('Largest difference of the predictions: ', np.abs(model_output - fused_model_output).max())
+    print('%-22s %14.2f' % ('run.py model', 1000 * model_time))
+    print('%-22s %14.2f %9.2fx' % ('run.py model, fused', 1000 * fused_model_time, model_time / fused_model_time))
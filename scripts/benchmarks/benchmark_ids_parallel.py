@@ -0,0 +1,64 @@
+"""
+benchmark_ids_parallel.py: This script measures how create_ids_matrix_parallel
+scales with the number of worker processes, and checks that the ids matrix
+is identical to the one of the serial create_ids_matrix for every number of
+workers.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import os
+import time
+from helpers import *
+
+
+words_list_path = '../../data/our_trained_wordvectors/word_list_sg_6.npy'
+path_positive = '../../data/twitter-datasets/train_pos_full.txt'
+path_negative = '../../data/twitter-datasets/train_neg_full.txt'
+max_seq_length = 20
+
+
+if __name__ == '__main__':
+
+    positive_files = []
+    with open(path_positive, "r", encoding='utf-8') as f:
+        for line in f:
+            positive_files.append(line)
+
+    negative_files = []
+    with open(path_negative, "r", encoding='utf-8') as f:
+        for line in f:
+            negative_files.append(line)
+
+    vocabulary = Vocabulary.from_npy(words_list_path)
+    lines = positive_files + negative_files
+
+    start = time.time()
+    ids_serial = create_ids_matrix(positive_files, negative_files, max_seq_length, vocabulary)
+    serial_time = time.time() - start
+
+    results = [('serial', serial_time)]
+
+    num_workers = 1
+    while num_workers <= multiprocessing.cpu_count():
+        start = time.time()
+        ids_parallel = create_ids_matrix_parallel(lines, max_seq_length, vocabulary, 'ids_benchmark.npy',
+                                                  num_workers=num_workers)
+        elapsed = time.time() - start
+
+        assert np.array_equal(ids_serial, ids_parallel)
+        del ids_parallel
+
+        results.append((str(num_workers) + ' workers', elapsed))
+        num_workers *= 2
+
+    os.remove('ids_benchmark.npy')
+
+    print('%-12s %12s %16s %10s' % ('version', 'time (s)', 'tweets/second', 'speed up'))
+    for version, elapsed in results:
+        print('%-12s %12.1f %16.0f %9.1fx' % (version, elapsed, len(lines) / elapsed, serial_time / elapsed))
@@ -0,0 +1,54 @@
+"""
+benchmark_prediction_cache.py: This script measures how many tweets of the test
+set are identical after the cleaning (same row of ids), and compares the time of the
+prediction of the test set with the model of 'run.py' (run_model.json and
+run_weights.h5) without and with the cache of the predictions (PredictionCache),
+checking that the predictions are the same. The prediction is done twice with the
+cache, to show the rows found in the cache of the previous batches.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import time
+from helpers import *
+
+
+model_path = '../best_score_two_kernels_CNN_LSTM/run_model.json'
+weights_path = '../best_score_two_kernels_CNN_LSTM/run_weights.h5'
+ids_test_path = '../../data/our_trained_wordvectors/ids_test_sg_6.npy'
+chunk_size = 1000
+cache_size = 100000
+
+
+def timed_prediction(predictor, ids):
+    """predictions of ids in chunks, as predict_to_submission, and seconds needed"""
+    start = time.time()
+    predictions = np.concatenate([predictor.predict_proba(np.asarray(ids[i:i+chunk_size]))
+                                  for i in range(0, len(ids), chunk_size)])
+    return predictions, time.time() - start
+
+
+ids_test = np.load(ids_test_path, mmap_mode='r')
+ids_test = np.asarray(ids_test)
+unique_rows = np.unique(ids_test.view(np.dtype((np.void, ids_test.dtype.itemsize * ids_test.shape[1]))))
+print('Identical rows in the test set: %d of %d' % (len(ids_test) - len(unique_rows), len(ids_test)))
+
+predictor = Predictor(model_path, weights_path)
+reference, reference_time = timed_prediction(predictor, ids_test)
+
+predictor.cache = PredictionCache(predictor._predict_model, cache_size)
+cached, cached_time = timed_prediction(predictor, ids_test)
+print('Largest difference of the predictions: ', np.abs(reference - cached).max())
+first_stats = predictor.cache.stats()
+cached_again, cached_again_time = timed_prediction(predictor, ids_test)
+
+print('%-22s %10s %10s %10s' % ('version', 'time (s)', 'hit rate', 'speed up'))
+print('%-22s %10.2f' % ('no cache', reference_time))
+print('%-22s %10.2f %10.3f %9.2fx' % ('cache', cached_time, first_stats['hit_rate'], reference_time / cached_time))
+print('%-22s %10.2f %10.3f %9.2fx' % ('cache, second pass', cached_again_time, predictor.cache.stats()['hit_rate'],
+                                      reference_time / cached_again_time))
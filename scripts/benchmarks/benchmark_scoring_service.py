@@ -0,0 +1,66 @@
+"""
+benchmark_scoring_service.py: This script is a load generator for the scoring
+service of 'scoring_service.py', that must be already running on this machine
+(run 'python scoring_service.py' from the main folder). For different numbers of
+concurrent clients, every client sends one tweet of the test set per request, and
+the script reports the p50 and p99 latency seen by the clients and the throughput,
+then the metrics of the service (with the mean size of its micro-batches).
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import json
+import threading
+import time
+import urllib.request
+from helpers import *
+
+
+url = 'http://localhost:8000'
+path_test = '../../data/twitter-datasets/test_data.txt'
+clients_list = [1, 4, 16, 64]
+requests_per_client = 100
+
+
+def post_tweet(text):
+    """sends one tweet to the service and returns the latency of the request"""
+    request = urllib.request.Request(url + '/predict', data=json.dumps({'text': text}).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    start = time.time()
+    urllib.request.urlopen(request).read()
+    return time.time() - start
+
+
+def run_client(tweets, latencies):
+    for text in tweets:
+        latencies.append(post_tweet(text))
+
+
+tweets = [line[line.index(',')+1:] for line in iter_lines([path_test])]
+
+print('%-8s %10s %10s %18s' % ('clients', 'p50 (ms)', 'p99 (ms)', 'requests/second'))
+for num_clients in clients_list:
+    latencies = []
+    threads = []
+    for i in range(num_clients):
+        start_tweet = (i * requests_per_client) % len(tweets)
+        client_tweets = tweets[start_tweet:start_tweet+requests_per_client]
+        threads.append(threading.Thread(target=run_client, args=(client_tweets, latencies)))
+
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    print('%-8d %10.2f %10.2f %18.0f' % (num_clients, 1000 * np.percentile(latencies, 50),
+                                         1000 * np.percentile(latencies, 99), len(latencies) / elapsed))
+
+print('Metrics of the service:')
+print(json.loads(urllib.request.urlopen(url + '/metrics').read().decode('utf-8')))
@@ -0,0 +1,50 @@
+"""
+benchmark_similarity.py: This script measures the latency of the top-k
+nearest neighbours queries of the SimilarityEngine on our word vectors,
+for a single word and for a batch of words, with the normalized vectors
+stored in float32 and in float16.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import time
+from helpers import *
+
+
+word_vecs_path = '../../data/our_trained_wordvectors/wordvecs_sg_6.npy'
+top_k = 8
+batch_size = 256
+repetitions = 10
+
+
+word_vecs = np.load(word_vecs_path, mmap_mode='r')[:-1]  # without the UNK vector
+queries = np.random.RandomState(1).choice(len(word_vecs), batch_size, replace=False)
+
+reference = None
+for dtype in ('float32', 'float16'):
+    start = time.time()
+    engine = SimilarityEngine(word_vecs, dtype=dtype)
+    print('%s: vectors normalized in %.2f s, %.0f MB' % (dtype, time.time() - start, engine.vectors.nbytes / 2.**20))
+
+    start = time.time()
+    for query in queries[:repetitions]:
+        engine.top_k(query, top_k)
+    print('%s: %.2f ms per single word query' % (dtype, 1000 * (time.time() - start) / repetitions))
+
+    start = time.time()
+    nearest, _ = engine.top_k(queries, top_k)
+    elapsed = time.time() - start
+    print('%s: %.2f ms per batch of %d words (%.3f ms per word)'
+          % (dtype, 1000 * elapsed, batch_size, 1000 * elapsed / batch_size))
+
+    if reference is None:
+        reference = nearest
+    else:
+        # fraction of the float32 neighbours also found with float16
+        overlap = np.mean([len(set(a) & set(b)) / float(top_k) for a, b in zip(reference, nearest)])
+        print('%s: %.3f overlap with the float32 neighbours' % (dtype, overlap))
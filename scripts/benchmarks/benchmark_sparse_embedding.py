@@ -0,0 +1,78 @@
+"""
+benchmark_sparse_embedding.py: This script measures the time of a training step
+of the two kernels CNN_LSTM of 'run.py', with the trainable Embedding layer, with
+the Adam optimizer of Keras (the whole embedding matrix is updated at every step)
+and with SparseAdam (only the rows of the words in the batch are updated). It
+also checks that the weights after the first step are the same with both.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import time
+from keras import Sequential
+from keras.layers import Embedding, Dropout, LSTM, Dense
+from helpers import *
+
+
+word_vecs_path = '../../data/our_trained_wordvectors/wordvecs_sg_6.npy'
+ids_path = '../../data/our_trained_wordvectors/ids_sg_6.npy'
+batch_size = 100
+steps = 50
+
+
+def build_model(word_vectors, max_seq_length):
+    """the architecture of 'run.py', with trainable word vectors"""
+    model = Sequential()
+    model.add(Embedding(word_vectors.shape[0], word_vectors.shape[1], input_length=max_seq_length,
+                        weights=[word_vectors], trainable=True))
+    model.add(Dropout(0.2))
+    model.add(conv_different_kernels(128, [2, 4], max_sentence_length=max_seq_length,
+                                     input_dim=(max_seq_length, word_vectors.shape[1])))
+    model.add(Dropout(0.2))
+    model.add(LSTM(256))
+    model.add(Dense(1, activation='sigmoid'))
+    return model
+
+
+wordVectors = load_embeddings(word_vecs_path)
+ids, labels, lengths = load_ids_dataset(ids_path)
+if labels is None:
+    labels = np.array([1] * int(len(ids)/2) + [0] * int(len(ids)/2))
+
+generator = batch_generator(ids, labels, batch_size)
+batches = [next(generator) for _ in range(steps + 1)]
+
+initial_weights = None
+first_step_weights = None
+results = []
+for name, optimizer_class in (('Adam', keras.optimizers.Adam), ('SparseAdam', SparseAdam)):
+    # the dropout is not used, so that the first steps are comparable
+    K.set_learning_phase(0)
+    model = build_model(wordVectors, ids.shape[1])
+    if initial_weights is None:
+        initial_weights = model.get_weights()
+    model.set_weights(initial_weights)
+    model.compile(loss='binary_crossentropy', optimizer=optimizer_class(lr=0.001), metrics=['accuracy'])
+
+    # the first step also builds the training function, it is not measured
+    model.train_on_batch(*batches[0])
+    if first_step_weights is None:
+        first_step_weights = model.get_weights()
+    else:
+        same = all(np.allclose(a, b, atol=1e-6) for a, b in zip(first_step_weights, model.get_weights()))
+        print('Same weights after the first step: ', same)
+
+    start = time.time()
+    for x_batch, y_batch in batches[1:]:
+        model.train_on_batch(x_batch, y_batch)
+    results.append((name, (time.time() - start) / steps))
+    K.clear_session()
+
+print('%-12s %14s %10s' % ('optimizer', 'step (ms)', 'speed up'))
+for name, step_time in results:
+    print('%-12s %14.1f %9.1fx' % (name, 1000 * step_time, results[0][1] / step_time))
@@ -0,0 +1,77 @@
+"""
+benchmark_submission.py: This script measures the time needed by make_submission
+to write 10k, 1M and 10M random predictions, both in the Keras format (1 / -1)
+and in the TensorFlow format (two logits). The old version, with one
+DataFrame.append per row, is measured only on 10k rows because it is quadratic.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import os
+import time
+from helpers import *
+
+
+sizes = [10000, 1000000, 10000000]
+legacy_size = 10000
+
+
+def make_submission_legacy(pred, filename, from_tf=False):
+    """the old make_submission, without the prints"""
+    indices = np.arange(len(pred))
+    df = pd.DataFrame()
+
+    for elem, idx in zip(pred, indices):
+        if from_tf:
+            final_pred = np.argmax(elem)
+            if final_pred == 0:
+                final_pred = 1
+            else:
+                final_pred = -1
+        else:
+            final_pred = int(elem)
+
+        df = df.append([[idx+1, final_pred]], ignore_index=True)
+
+    df.columns = ['Id', 'Prediction']
+    df.to_csv(filename, index=False)
+
+
+def random_predictions(size, from_tf, seed=1):
+    random_state = np.random.RandomState(seed)
+    if from_tf:
+        return random_state.randn(size, 2).astype('float32')
+    return np.where(random_state.rand(size) >= 0.5, 1., -1.).astype('float32')
+
+
+results = []
+for from_tf in (False, True):
+    pred_format = 'tf' if from_tf else 'keras'
+
+    pred = random_predictions(legacy_size, from_tf)
+    start = time.time()
+    make_submission_legacy(pred, 'legacy_benchmark.csv', from_tf=from_tf)
+    results.append(('legacy', pred_format, legacy_size, time.time() - start))
+
+    # the new version has to write the same file
+    make_submission(pred, 'submission_benchmark.csv', from_tf=from_tf)
+    with open('legacy_benchmark.csv') as legacy_file, open('submission_benchmark.csv') as new_file:
+        assert legacy_file.read().split() == new_file.read().split()
+
+    for size in sizes:
+        pred = random_predictions(size, from_tf)
+        start = time.time()
+        make_submission(pred, 'submission_benchmark.csv', from_tf=from_tf)
+        results.append(('vectorized', pred_format, size, time.time() - start))
+
+os.remove('legacy_benchmark.csv')
+os.remove('submission_benchmark.csv')
+
+print('%-12s %-8s %10s %10s %14s' % ('version', 'format', 'rows', 'time (s)', 'rows/second'))
+for version, pred_format, size, elapsed in results:
+    print('%-12s %-8s %10d %10.2f %14.0f' % (version, pred_format, size, elapsed, size / elapsed))
@@ -0,0 +1,52 @@
+"""
+benchmark_tf_export.py: This script compares the LSTMPredictor restored from
+the training checkpoint (float64 LSTM) with the one loaded from the float32
+SavedModel exported by 'export_tf_lstm.py': startup time, memory of the
+embedding, latency per batch and difference between the logits.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import time
+from tf_lstm import *
+
+
+word_vectors_path = '../../data/our_trained_wordvectors/wordvecs_sg_6.npy'
+ids_test_path = '../../data/our_trained_wordvectors/ids_test_sg_6.npy'
+checkpoint_dir = '../../data/models'
+saved_model_dir = '../../data/models/lstm_saved_model'
+batch_sizes = [1, 100, 1000]
+repetitions = 20
+
+
+ids_test = np.load(ids_test_path)
+wordVectors = np.load(word_vectors_path)
+
+start = time.time()
+checkpoint_predictor = LSTMPredictor(wordVectors, checkpoint_dir=checkpoint_dir)
+print('checkpoint: started in %.2f s, embedding of %.0f MB'
+      % (time.time() - start, wordVectors.astype('float64').nbytes / 2.**20))
+
+start = time.time()
+saved_model_predictor = LSTMPredictor.from_saved_model(saved_model_dir)
+print('SavedModel: started in %.2f s, embedding of %.0f MB'
+      % (time.time() - start, wordVectors.astype('float32').nbytes / 2.**20))
+
+for batch_size in batch_sizes:
+    batch = ids_test[:batch_size]
+    for name, predictor in (('checkpoint', checkpoint_predictor), ('SavedModel', saved_model_predictor)):
+        predictor.predict_logits(batch, batch_size)  # warm up
+        start = time.time()
+        for _ in range(repetitions):
+            predictor.predict_logits(batch, batch_size)
+        print('%s: %.2f ms per batch of %d' % (name, 1000 * (time.time() - start) / repetitions, batch_size))
+
+logits_checkpoint = checkpoint_predictor.predict_logits(ids_test)
+logits_saved_model = saved_model_predictor.predict_logits(ids_test)
+print('Max difference between the logits: %g' % np.max(np.abs(logits_checkpoint - logits_saved_model)))
+print('Same label for %.4f of the tweets' % np.mean(np.argmax(logits_checkpoint, 1) == np.argmax(logits_saved_model, 1)))
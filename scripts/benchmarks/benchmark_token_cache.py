@@ -0,0 +1,77 @@
+"""
+benchmark_token_cache.py: This script measures the time of a pass over the
+combined tweets with and without the TokenCache (the first pass builds the
+cache, the following ones replay it), and the time of the creation of the ids
+matrix of the train set from the cache and from the text, checking that the
+sentences and the ids matrices are identical.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import shutil
+import time
+from helpers import *
+
+
+sentences_dir = '../../data/combined_tweets'
+words_list_path = '../../data/our_trained_wordvectors/word_list_sg_6.npy'
+path_positive = '../../data/twitter-datasets/train_pos_full.txt'
+path_negative = '../../data/twitter-datasets/train_neg_full.txt'
+cache_dir = 'token_cache_benchmark'
+max_seq_length = 20
+
+
+def timed_pass(sentences):
+    """time of a pass over the sentences, and number of words seen"""
+    start = time.time()
+    num_words = 0
+    for sentence in sentences:
+        num_words += len(sentence)
+    return time.time() - start, num_words
+
+
+if __name__ == '__main__':
+
+    text_time, text_words = timed_pass(MySentences(sentences_dir))
+
+    cached_sentences = MySentences(sentences_dir, cache_dir=cache_dir)
+    build_time, _ = timed_pass(cached_sentences)
+    replay_time, replay_words = timed_pass(cached_sentences)
+    assert text_words == replay_words
+    assert all(a == b for a, b in zip(MySentences(sentences_dir), cached_sentences))
+
+    print('%-22s %10s' % ('pass over the tweets', 'time (s)'))
+    print('%-22s %10.1f' % ('clean_sentences', text_time))
+    print('%-22s %10.1f' % ('first (builds cache)', build_time))
+    print('%-22s %10.1f %9.1fx' % ('replay', replay_time, text_time / replay_time))
+
+    vocabulary = Vocabulary.from_npy(words_list_path)
+
+    start = time.time()
+    ids_text = create_ids_dataset(path_positive, path_negative, max_seq_length, vocabulary, 'ids_text.npy')
+    text_time = time.time() - start
+
+    # the caches of the train files are built before measuring
+    create_ids_dataset(path_positive, path_negative, max_seq_length, vocabulary, 'ids_cached.npy',
+                       cache_dir=cache_dir)
+    start = time.time()
+    ids_cached = create_ids_dataset(path_positive, path_negative, max_seq_length, vocabulary, 'ids_cached.npy',
+                                    cache_dir=cache_dir)
+    cached_time = time.time() - start
+
+    assert np.array_equal(ids_text, ids_cached)
+    del ids_text, ids_cached
+
+    print('%-22s %10s' % ('ids matrix', 'time (s)'))
+    print('%-22s %10.1f' % (str(multiprocessing.cpu_count()) + ' workers', text_time))
+    print('%-22s %10.1f %9.1fx' % ('token cache', cached_time, text_time / cached_time))
+
+    for path in ('ids_text.npy', 'ids_cached.npy'):
+        os.remove(path)
+        os.remove(ids_header_path(path))
+    shutil.rmtree(cache_dir)
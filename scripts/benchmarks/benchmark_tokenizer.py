@@ -0,0 +1,97 @@
+"""
+benchmark_tokenizer.py: This script checks that the precompiled Tokenizer
+(used by clean_sentences) produces exactly the same tokens as the old
+chained str.replace version on the tweets of the data set (golden output),
+and then measures the tokens/second of both versions.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import re
+import time
+from helpers import *
+
+
+tweets_paths = ['../../data/twitter-datasets/train_pos_full.txt',
+                '../../data/twitter-datasets/train_neg_full.txt',
+                '../../data/twitter-datasets/test_data.txt']
+
+# number of tweets read from each file
+num_tweets = 200000
+
+# number of repetitions of each measure, the best one is reported
+repetitions = 3
+
+
+def clean_sentences_legacy(string):
+    """the version of clean_sentences with the chained str.replace calls"""
+
+    string = string.lower().replace("<br />", " ")
+    string = string.replace("n't", " not")
+    string = string.replace("'m", " am")
+    string = string.replace("'ll", " will")
+    string = string.replace("'d", " would")
+    string = string.replace("'ve", " have")
+    string = string.replace("'re", " are")
+    string = string.replace("'s", " is")
+    string = string.replace("#", "<hashhtagg> ")
+    string = string.replace("lol", "laugh")
+    string = string.replace("<3", "love")
+    string = string.replace("<user>", "")
+    string = string.replace("<url>", "")
+
+    strip_special_chars = re.compile("[^A-Za-z0-9 ]+")
+    string = re.sub(strip_special_chars, "", string.lower())
+
+    string = string.split()
+
+    string = [w.replace("wo", "will") for w in string]
+    string = [w.replace("ca", "can") for w in string]
+    string = [w.replace("sha", "shall") for w in string]
+
+    return string
+
+
+def best_time(function, lines):
+    """returns the best time over the repetitions and the output of the function"""
+    times = []
+    for _ in range(repetitions):
+        start = time.time()
+        output = function(lines)
+        times.append(time.time() - start)
+    return min(times), output
+
+
+lines = []
+for path in tweets_paths:
+    with open(path, "r", encoding='utf-8') as f:
+        for counter, line in enumerate(f):
+            if counter >= num_tweets:
+                break
+            lines.append(line)
+
+# golden output: the old implementation on the whole sample
+golden = [clean_sentences_legacy(line) for line in lines]
+num_tokens = sum(len(tokens) for tokens in golden)
+
+tokenizer = Tokenizer()
+mismatches = [line for line, tokens in zip(lines, golden) if tokenizer.tokenize(line) != tokens]
+print('Mismatches with the golden output: %d over %d tweets' % (len(mismatches), len(lines)))
+for line in mismatches[:10]:
+    print(repr(line))
+assert len(mismatches) == 0
+
+elapsed, _ = best_time(lambda sentences: [clean_sentences_legacy(line) for line in sentences], lines)
+print('chained replace:          %.0f tokens/second' % (num_tokens / elapsed))
+
+elapsed, _ = best_time(lambda sentences: [tokenizer.tokenize(line) for line in sentences], lines)
+print('Tokenizer.tokenize:       %.0f tokens/second' % (num_tokens / elapsed))
+
+elapsed, output = best_time(tokenizer.tokenize_batch, lines)
+assert output == golden
+print('Tokenizer.tokenize_batch: %.0f tokens/second' % (num_tokens / elapsed))
@@ -0,0 +1,85 @@
+"""
+benchmark_vocabulary.py: This script compares the throughput (tweets/second)
+of the ids matrix creation with the old list.index lookups and with the
+hash-indexed Vocabulary. The list.index version is really slow, so it is
+run only on the first tweets of the positive train file.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import tempfile
+import time
+from helpers import *
+
+
+words_list_path = '../../data/our_trained_wordvectors/word_list_sg_6.npy'
+tweets_path = '../../data/twitter-datasets/train_pos_full.txt'
+max_seq_length = 20
+
+# number of tweets used for each version
+num_tweets_list_index = 2000
+num_tweets_vocabulary = 200000
+
+
+def ids_with_list_index(tweets, words_list):
+    """the lookup that create_ids_matrix used before the Vocabulary"""
+    ids = np.zeros((len(tweets), max_seq_length), dtype='int32')
+    for file_counter, line in enumerate(tweets):
+        for index_counter, word in enumerate(clean_sentences(line)[:max_seq_length]):
+            try:
+                ids[file_counter][index_counter] = words_list.index(word)
+            except ValueError:
+                ids[file_counter][index_counter] = len(words_list) - 1
+    return ids
+
+
+def ids_with_vocabulary(tweets, vocabulary):
+    ids = np.zeros((len(tweets), max_seq_length), dtype='int32')
+    for file_counter, line in enumerate(tweets):
+        row = vocabulary.sentence_to_ids(clean_sentences(line), max_seq_length)
+        ids[file_counter, :len(row)] = row
+    return ids
+
+
+tweets = []
+with open(tweets_path, "r", encoding='utf-8') as f:
+    for line in f:
+        tweets.append(line)
+        if len(tweets) >= num_tweets_vocabulary:
+            break
+
+words_list = np.load(words_list_path).tolist()
+
+start = time.time()
+vocabulary = Vocabulary(words_list)
+print('Vocabulary built in %.3f s (%d words)' % (time.time() - start, len(vocabulary)))
+
+# the text file is written in a temporary file, deleted after the measure
+vocab_file, vocab_path = tempfile.mkstemp(suffix='.txt')
+os.close(vocab_file)
+try:
+    vocabulary.save(vocab_path)
+    start = time.time()
+    vocabulary = Vocabulary.load(vocab_path)
+    print('Vocabulary loaded from text file in %.3f s' % (time.time() - start))
+finally:
+    os.remove(vocab_path)
+
+start = time.time()
+ids_old = ids_with_list_index(tweets[:num_tweets_list_index], words_list)
+elapsed_old = time.time() - start
+print('list.index: %.1f tweets/second' % (num_tweets_list_index / elapsed_old))
+
+start = time.time()
+ids_new = ids_with_vocabulary(tweets, vocabulary)
+elapsed_new = time.time() - start
+print('Vocabulary: %.1f tweets/second' % (len(tweets) / elapsed_new))
+
+# both versions have to produce the same ids
+assert np.array_equal(ids_old, ids_new[:num_tweets_list_index])
+print('Speed up: %.1fx' % ((len(tweets) / elapsed_new) / (num_tweets_list_index / elapsed_old)))
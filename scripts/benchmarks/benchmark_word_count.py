@@ -0,0 +1,60 @@
+"""
+benchmark_word_count.py: This script measures how count_words (used by
+create_word_list) scales with the number of worker processes, streaming the
+train files from disk, and checks that the counts are identical to the ones
+of a single-threaded count over the tweets loaded in memory.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import time
+from helpers import *
+
+
+path_positive = '../../data/twitter-datasets/train_pos_full.txt'
+path_negative = '../../data/twitter-datasets/train_neg_full.txt'
+min_count = 6
+
+
+if __name__ == '__main__':
+
+    documents = list(iter_lines([path_positive, path_negative]))
+
+    # single-threaded count, as create_word_list did before
+    start = time.time()
+    word_dict = {}
+    for document in documents:
+        for word in clean_sentences(document):
+            if word not in word_dict:
+                word_dict[word] = 1
+            else:
+                word_dict[word] += 1
+    serial_time = time.time() - start
+
+    results = [('serial', serial_time)]
+    reference = None
+
+    num_workers = 1
+    while num_workers <= multiprocessing.cpu_count():
+        start = time.time()
+        counts = count_words(iter_lines([path_positive, path_negative]), num_workers=num_workers)
+        elapsed = time.time() - start
+
+        assert dict(counts) == word_dict
+        vocabulary = sorted_vocabulary(counts, min_count)
+        if reference is None:
+            reference = vocabulary
+        assert vocabulary == reference
+
+        results.append((str(num_workers) + ' workers', elapsed))
+        num_workers *= 2
+
+    print('%d words, %d with at least %d occurrences' % (len(word_dict), len(reference), min_count))
+    print('%-12s %12s %16s %10s' % ('version', 'time (s)', 'tweets/second', 'speed up'))
+    for version, elapsed in results:
+        print('%-12s %12.1f %16.0f %9.1fx' % (version, elapsed, len(documents) / elapsed, serial_time / elapsed))
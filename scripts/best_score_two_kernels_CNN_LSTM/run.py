@@ -20,17 +20,22 @@ __status__    = "Project"
 from keras import Sequential
 from keras.layers import Embedding, Dropout, LSTM, Dense
 from helpers import *
+from keras_data_parallel import fit_data_parallel
 
 
-# loading our wordVectors
-wordVectors = np.load('../../data/our_trained_wordvectors/wordvecs_sg_6.npy')
+# set to '_pruned' to use the smaller vocabulary created by 'prune_vocabulary.py' (only the words
+# that appear in the tweets): the trainable Embedding layer is then much faster to train
+vocabulary_suffix = ''
+
+# loading our wordVectors (float32, memory-mapped: Keras copies them directly in the Embedding layer)
+wordVectors = load_embeddings('../../data/our_trained_wordvectors/wordvecs_sg_6' + vocabulary_suffix + '.npy')
 print('Loaded the word vectors!')
 
-# loading our ids matrix
-ids = np.load('../../data/our_trained_wordvectors/ids_sg_6.npy')
+# loading our ids matrix, memory-mapped: the rows are read from disk only when they are used
+ids, labels, lengths = load_ids_dataset('../../data/our_trained_wordvectors/ids_sg_6' + vocabulary_suffix + '.npy')
 
-# splitting our data in train and test sets
-x_train, x_test, y_train, y_test = split_data(ids, 0.9)
+# splitting our data in train and test sets (views on the ids matrix, not copies)
+x_train, x_test, y_train, y_test = split_data(ids, 0.9, labels=labels, lazy=True)
 
 print('Build model...')
 
@@ -40,6 +45,10 @@ max_seq_length = ids.shape[1]
 embedding_size = wordVectors.shape[1]
 trainable = True
 
+# if True (and trainable), only the word vectors of the words in the batch are updated at every step
+# (see SparseAdam in helpers.py) instead of the whole embedding matrix, so the steps are much faster
+sparse_embedding_updates = False
+
 # here we define the parameters for the convolutional Layer
 # kernel sizes contains the size of the two windows used for grouping words to compute a new feature
 filters_shapes = [2, 4]
@@ -65,6 +74,10 @@ else:
 batch_size = 100
 epochs = 5
 
+# number of processes that train the model together, each one computing the gradients of a part of every
+# batch (see keras_data_parallel.py); with 1, the model is trained in this process with fit_generator
+num_workers = 1
+
 # creating the model structure
 model = Sequential()
 
@@ -93,7 +106,10 @@ model.add(Dense(1, activation='sigmoid'))
 # defining the optimizers. We used the default values
 # as suggested on the Keras documentation, we explicitly reported
 # them for clarity.
-adam_optimizer = keras.optimizers.Adam(lr=0.001, beta_1=0.9, beta_2=0.999, epsilon=1e-08, decay=0.0)
+if trainable and sparse_embedding_updates:
+    adam_optimizer = SparseAdam(lr=0.001, beta_1=0.9, beta_2=0.999, epsilon=1e-08, decay=0.0)
+else:
+    adam_optimizer = keras.optimizers.Adam(lr=0.001, beta_1=0.9, beta_2=0.999, epsilon=1e-08, decay=0.0)
 
 # compiling our model
 model.compile(loss='binary_crossentropy',
@@ -110,16 +126,23 @@ print(x_train.shape)
 # defining our callback to save metrics in order to create the plots (loss, accuracy)
 history = History()
 
-# fitting the model with our train sets
+# fitting the model with our train sets, read batch by batch from the memory-mapped ids matrix
+train_steps = int(np.ceil(len(x_train) / batch_size))
+test_steps = int(np.ceil(len(x_test) / batch_size))
 
-model.fit(x_train, y_train,
-          batch_size=batch_size,
-          epochs=epochs,
-          validation_data=(x_test, y_test),
-          callbacks=[history])
+if num_workers > 1:
+    # same batches and same metrics in history, the gradients of every batch are computed by num_workers processes
+    fit_data_parallel(model, x_train, y_train, x_test, y_test, batch_size, epochs, num_workers, history=history)
+else:
+    model.fit_generator(batch_generator(x_train, y_train, batch_size),
+                        steps_per_epoch=train_steps,
+                        epochs=epochs,
+                        validation_data=batch_generator(x_test, y_test, batch_size, shuffle=False),
+                        validation_steps=test_steps,
+                        callbacks=[history])
 
 # evaluating our model on the test sets
-score, acc = model.evaluate(x_test, y_test, batch_size=batch_size)
+score, acc = model.evaluate_generator(batch_generator(x_test, y_test, batch_size, shuffle=False), steps=test_steps)
 print('Test score:', score)
 print('Test accuracy:', acc)
 
@@ -135,7 +158,7 @@ print("Saved model to disk")
 # creating the prediction on test set csv file
 keras_prediction(model_path="run_model.json",
                  weights_path="run_weights.h5",
-                 ids_test_path="../../data/our_trained_wordvectors/ids_test_sg_6.npy",
+                 ids_test_path="../../data/our_trained_wordvectors/ids_test_sg_6" + vocabulary_suffix + ".npy",
                  csv_file_name="run_prediction.csv")
 
 # saving the validation accuracy for each epoch
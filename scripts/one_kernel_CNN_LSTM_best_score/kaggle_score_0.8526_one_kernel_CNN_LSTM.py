@@ -20,14 +20,15 @@ import numpy as np
 
 
 # loading our word vectors
-wordVectors = np.load('../../data/our_trained_wordvectors/wordvecs_sg_6.npy')
+wordVectors = load_embeddings('../../data/our_trained_wordvectors/wordvecs_sg_6.npy')
 print(wordVectors.shape)
 print('Loaded the word vectors!')
 
 # ids = create_ids_matrix(positive_files, negative_files, max_seq_length, wordsList
-ids = np.load('../../data/our_trained_wordvectors/ids_sg_6.npy')
+# memory-mapped ids matrix, the rows are read from disk only when they are used
+ids, labels, lengths = load_ids_dataset('../../data/our_trained_wordvectors/ids_sg_6.npy')
 
-x_train, x_test, y_train, y_test = split_data(ids, 0.9)
+x_train, x_test, y_train, y_test = split_data(ids, 0.9, labels=labels, lazy=True)
 
 print('Build model...')
 
@@ -92,14 +93,18 @@ print('Train...')
 # in order to create the plots (loss, accuracy)
 history = History()
 
-# fitting the model with our data
-model.fit(x_train, y_train,
-          batch_size=batch_size,
-          epochs=epochs,
-          validation_data=(x_test, y_test))
+# fitting the model with our data, read batch by batch from the memory-mapped ids matrix
+train_steps = int(np.ceil(len(x_train) / batch_size))
+test_steps = int(np.ceil(len(x_test) / batch_size))
+
+model.fit_generator(batch_generator(x_train, y_train, batch_size),
+                    steps_per_epoch=train_steps,
+                    epochs=epochs,
+                    validation_data=batch_generator(x_test, y_test, batch_size, shuffle=False),
+                    validation_steps=test_steps)
 
 # evaluating our model on the test sets
-score, acc = model.evaluate(x_test, y_test, batch_size=batch_size)
+score, acc = model.evaluate_generator(batch_generator(x_test, y_test, batch_size, shuffle=False), steps=test_steps)
 print('Test score:', score)
 print('Test accuracy:', acc)
 
@@ -0,0 +1,79 @@
+"""
+skipgram_incremental.py: This script updates the word embeddings, the word list
+and the ids matrix of the train set with a batch of new tweets (e.g. of one day),
+without recomputing everything as in 'skipgram_gensim.py'. The new tweets are in the
+directory "data/new_tweets", with the positive and the negative ones in two files.
+The skip-gram model continues its training on the new sentences only, the new words
+that appear at least min_count times are appended to the word list (after 'UNK') and
+only the rows of the new tweets are appended to the ids matrix, so the ids of the
+words and of the tweets that were already there do not change.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+
+from gensim import models
+
+import logging
+from helpers import *
+
+
+model_path = "model_sg_6"
+word_vecs_path = 'data/our_trained_wordvectors/wordvecs_sg_6.npy'
+word_list_path = 'data/our_trained_wordvectors/word_list_sg_6.npy'
+ids_path = 'data/our_trained_wordvectors/ids_sg_6.npy'
+
+new_tweets_dir = "data/new_tweets"
+path_positive = os.path.join(new_tweets_dir, "train_pos_new.txt")
+path_negative = os.path.join(new_tweets_dir, "train_neg_new.txt")
+
+
+if __name__ == '__main__':
+
+    '''For logging the process'''
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+    '''Continue the training of the gensim model on the new sentences only'''
+    sentences = MySentences(new_tweets_dir)  # a memory-friendly iterator
+
+    model = models.Word2Vec.load(model_path)
+    # the new words are added with the min_count of the model (6), counted on the new sentences;
+    # the counts of the words already in the vocabulary are increased
+    model.build_vocab(sentences, update=True)
+    model.train(sentences, total_examples=model.corpus_count, epochs=model.iter)
+    model.save(model_path)
+
+    '''Extend the word list, keeping the ids of the old words'''
+    vocabulary = Vocabulary.from_npy(word_list_path)
+    old_word_vecs = load_embeddings(word_vecs_path)
+
+    new_words = vocabulary.extend(word for word in model.wv.index2word if word not in vocabulary)
+    print('The number of new words is', len(new_words))
+
+    # the vectors of all the words are updated with the new training, the UNK vector stays the same
+    word_vecs = np.zeros((len(vocabulary), old_word_vecs.shape[1]), dtype='float32')
+    for i, word in enumerate(vocabulary.words):
+        if i == vocabulary.unk_id:
+            word_vecs[i] = old_word_vecs[i]
+        else:
+            word_vecs[i] = model.wv[word]
+    print(word_vecs.shape)
+
+    del model, old_word_vecs
+
+    '''Saving'''
+    save_embeddings(word_vecs_path, word_vecs)
+    for dtype in ('float16', 'int8'):
+        save_embeddings(embeddings_path(word_vecs_path, dtype), word_vecs, dtype)
+    np.save(word_list_path, vocabulary.words)
+    vocabulary.save('data/our_trained_wordvectors/vocab_sg_6.txt')
+
+    '''Append the ids of the new tweets'''
+    # the old rows are not rewritten: their unknown words stay 'UNK' even if they are new words now
+    num_rows = append_ids_dataset(ids_path, path_positive, path_negative, vocabulary)
+    print('Appended %d tweets to %s' % (num_rows, ids_path))
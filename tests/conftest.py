@@ -0,0 +1,8 @@
+"""
+conftest.py: makes the modules of the project (helpers.py, ...) importable by the tests.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,41 @@
+"""
+test_prediction_cache.py: This file contains the tests of the PredictionCache of 'helpers.py'.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import numpy as np
+from helpers import PredictionCache
+
+
+def test_rows_of_ids():
+    ids = np.random.RandomState(0).randint(0, 5, (200, 3)).astype('int32')
+    cache = PredictionCache(lambda x: x.sum(axis=1))
+    assert np.array_equal(cache(ids), ids.sum(axis=1))
+    # the second time every row is found in the cache
+    assert np.array_equal(cache(ids), ids.sum(axis=1))
+    assert cache.stats()['cache_hits'] == cache.num_unique / 2
+
+
+def test_rows_of_more_than_one_dimension():
+    # every row is a (max sequence length x dimensions) matrix, e.g. the word vectors of a row of ids
+    rows = np.random.RandomState(1).rand(50, 4, 3).astype('float32')
+    rows = rows[np.random.RandomState(2).randint(0, len(rows), 200)]
+    cache = PredictionCache(lambda x: x.sum(axis=(1, 2)))
+    assert np.array_equal(cache(rows), rows.sum(axis=(1, 2)))
+    assert cache.stats()['predicted'] == len(np.unique(rows.reshape(len(rows), -1), axis=0))
+
+
+def test_rows_that_differ_in_one_vector():
+    # the two rows differ only in their second word vector: they are different entries of the cache
+    rows = np.array([[[1, 2], [3, 4]], [[1, 2], [4, 3]]], dtype='int32')
+    assert PredictionCache(lambda x: x[:, 1, 0])(rows).tolist() == [3, 4]
+
+
+def test_empty_batch():
+    assert len(PredictionCache(lambda x: x.sum(axis=1))(np.empty((0, 3), dtype='int32'))) == 0
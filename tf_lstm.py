@@ -0,0 +1,340 @@
+"""
+tf_lstm.py: This file contains the graph of our LSTM architecture built with
+TensorFlow and the LSTMPredictor, a persistent inference session that builds
+the graph and restores the checkpoint only once, so that it can be called
+repeatedly (e.g. by a service) with batches of any size. The checkpoint can
+also be exported as a float32, inference-only SavedModel (export_saved_model)
+that starts faster and uses half the memory.
+"""
+
+__author__    = "Christian Sciuto, Eigil Lippert and Lorenzo Tarantino"
+__copyright__ = "Copyright 2017, Second Machine Learning Project, EPFL Machine Learning Course CS-433, Fall 2017"
+__credits__   = ["Christian Sciuto", "Eigil Lippert", "Lorenzo Tarantino"]
+__license__   = "MIT"
+__version_    = "1.0.1"
+__status__    = "Project"
+
+import tensorflow as tf
+from helpers import *
+
+
+def last_relevant_output(value, sequence_length):
+    """
+    output of the cell at the last token of every row, given the outputs
+    of dynamic_rnn (batch x time x units) and the number of tokens of the rows
+    """
+    rows = tf.range(tf.shape(value)[0])
+    return tf.gather_nd(value, tf.stack([rows, sequence_length - 1], axis=1))
+
+
+def build_lstm_graph(embedding, input_data, lstm_units=128, num_classes=2, keep_prob=1.0, sequence_length=None):
+    """
+    builds the LSTM architecture of 'LSTM_kaggle_score_0.85620.py' on top of
+    an embedding tensor and returns the logits of the two classes, with the
+    weight and bias of the final layer.
+    Dropout is applied only if keep_prob < 1 (it is not needed for inference).
+    The batch size is dynamic, given by the shape of input_data.
+    If sequence_length (number of tokens of every row, at least 1) is given,
+    the LSTM stops at the last token of every row instead of running over the
+    padding, and the logits are computed from the output at that token.
+    If embedding is None, input_data already contains the word vectors of the
+    rows (batch x time x dimensions), in the precision of the LSTM.
+    """
+    if embedding is None:
+        data = input_data
+    else:
+        data = tf.nn.embedding_lookup(embedding, input_data)
+
+    lstm_cell = tf.nn.rnn_cell.BasicLSTMCell(lstm_units)
+    if keep_prob < 1:
+        lstm_cell = tf.nn.rnn_cell.DropoutWrapper(cell=lstm_cell, output_keep_prob=keep_prob)
+
+    value, _ = tf.nn.dynamic_rnn(lstm_cell, data, dtype=data.dtype, sequence_length=sequence_length)
+
+    weight = tf.Variable(tf.truncated_normal([lstm_units, num_classes]), name='weight')
+    bias = tf.Variable(tf.constant(0.1, shape=[num_classes]), name='bias')
+
+    # last output of the cell
+    if sequence_length is None:
+        last = value[:, -1, :]
+    else:
+        last = last_relevant_output(value, sequence_length)
+    last = tf.cast(last, tf.float32)
+    prediction = tf.matmul(last, weight) + bias
+    return prediction, weight, bias
+
+
+def checkpoint_var_list(weight, bias):
+    """
+    maps the names of the variables in the checkpoints saved by
+    'LSTM_kaggle_score_0.85620.py' to the variables of build_lstm_graph.
+    In the training graph the unused 'data' zeros variable is created
+    first, so the weight and bias are saved as Variable_1 and Variable_2
+    """
+    var_list = {'Variable_1': weight, 'Variable_2': bias}
+    for variable in tf.global_variables():
+        if variable.op.name.startswith('rnn/'):
+            var_list[variable.op.name] = variable
+    return var_list
+
+
+class LSTMPredictor(object):
+    """
+    persistent inference session of the TensorFlow LSTM. The graph is built
+    and the checkpoint restored once, in the constructor; predict_logits can
+    then be called any number of times with any number of rows.
+
+    predictor = LSTMPredictor(wordVectors, 'data/models')
+    logits = predictor.predict_logits(ids_test)
+
+    A checkpoint trained with use_sequence_length needs the lengths of the rows
+    (saved in the header of the ids matrix, see load_ids_dataset):
+
+    predictor = LSTMPredictor(wordVectors, 'data/models', use_sequence_length=True)
+    logits = predictor.predict_logits(ids_test, lengths=lengths_test)
+    """
+
+    def __init__(self, word_vectors, checkpoint_dir='data/models', lstm_units=128, num_classes=2, cache_size=None,
+                 embedded_input=False, use_sequence_length=False):
+        """
+        :param word_vectors: word vectors matrix used during training
+        :param checkpoint_dir: directory of the checkpoints of the training script
+        :param lstm_units: number of units of the LSTM cell
+        :param num_classes: number of output classes
+        :param cache_size: if given, the identical rows are predicted only once,
+                           with a PredictionCache of cache_size rows (self.cache)
+        :param embedded_input: if True, predict_logits takes the float32 word vectors of the
+                               rows (batch x length x dimensions) instead of their ids, and the
+                               word vectors are not copied in the graph (e.g. when they are
+                               shared with other models, see EnsemblePredictor)
+        :param use_sequence_length: True if the checkpoint was trained with use_sequence_length: the
+                                    LSTM stops at the last token of every row, whose number of tokens
+                                    is given to predict_logits
+        """
+        if embedded_input and use_sequence_length and cache_size is not None:
+            raise ValueError('the cache of the predictions needs the ids of the rows with use_sequence_length')
+        self.num_classes = num_classes
+        self.cache = None
+        if cache_size is not None:
+            self.cache = PredictionCache(self._run_rows, cache_size)
+        self.graph = tf.Graph()
+
+        # the LSTM runs in the precision of the word vectors used for training
+        # (float64 for our first checkpoints, float32 for the following ones)
+        checkpoint = tf.train.latest_checkpoint(checkpoint_dir)
+        dtypes = tf.train.NewCheckpointReader(checkpoint).get_variable_to_dtype_map()
+        rnn_dtype = [dtype for name, dtype in dtypes.items() if name.startswith('rnn/')][0]
+
+        if embedded_input:
+            with self.graph.as_default():
+                self.input_data = tf.placeholder(tf.float32, [None, None, word_vectors.shape[1]], name='input_data')
+                self.sequence_length = self._sequence_length_placeholder(use_sequence_length)
+                data = tf.cast(self.input_data, rnn_dtype)
+                self.prediction, weight, bias = build_lstm_graph(None, data, lstm_units, num_classes,
+                                                                 sequence_length=self.sequence_length)
+
+                saver = tf.train.Saver(var_list=checkpoint_var_list(weight, bias))
+
+            self.session = tf.Session(graph=self.graph)
+            saver.restore(self.session, checkpoint)
+            return
+
+        word_vectors = np.asarray(word_vectors, dtype=rnn_dtype.as_numpy_dtype)
+
+        with self.graph.as_default():
+            # the embedding is a variable, initialized once from a placeholder,
+            # so the word vectors are not copied as a constant in the graph
+            word_vectors_init = tf.placeholder(word_vectors.dtype, word_vectors.shape)
+            embedding = tf.Variable(word_vectors_init, trainable=False, name='embedding')
+
+            self.input_data = tf.placeholder(tf.int32, [None, None], name='input_data')
+            self.sequence_length = self._sequence_length_placeholder(use_sequence_length)
+            self.prediction, weight, bias = build_lstm_graph(embedding, self.input_data, lstm_units, num_classes,
+                                                             sequence_length=self.sequence_length)
+
+            saver = tf.train.Saver(var_list=checkpoint_var_list(weight, bias))
+
+        self.session = tf.Session(graph=self.graph)
+        self.session.run(embedding.initializer, {word_vectors_init: word_vectors})
+        saver.restore(self.session, checkpoint)
+
+    @classmethod
+    def from_saved_model(cls, export_dir, cache_size=None):
+        """
+        loads the float32 inference graph exported by export_saved_model,
+        restoring its variables instead of rebuilding the graph from the word vectors.
+        If the model was exported with use_sequence_length, predict_logits needs the lengths of the rows
+        """
+        predictor = cls.__new__(cls)
+        predictor.cache = None
+        if cache_size is not None:
+            predictor.cache = PredictionCache(predictor._run_rows, cache_size)
+        predictor.graph = tf.Graph()
+        predictor.session = tf.Session(graph=predictor.graph)
+
+        with predictor.graph.as_default():
+            meta_graph = tf.saved_model.loader.load(predictor.session, [tf.saved_model.tag_constants.SERVING],
+                                                    export_dir)
+
+        signature = meta_graph.signature_def[tf.saved_model.signature_constants.DEFAULT_SERVING_SIGNATURE_DEF_KEY]
+        predictor.input_data = predictor.graph.get_tensor_by_name(signature.inputs['input_data'].name)
+        predictor.sequence_length = None
+        if 'sequence_length' in signature.inputs:
+            predictor.sequence_length = predictor.graph.get_tensor_by_name(signature.inputs['sequence_length'].name)
+        predictor.prediction = predictor.graph.get_tensor_by_name(signature.outputs['prediction'].name)
+        predictor.num_classes = int(predictor.prediction.get_shape()[1])
+        return predictor
+
+    @staticmethod
+    def _sequence_length_placeholder(use_sequence_length):
+        if not use_sequence_length:
+            return None
+        return tf.placeholder(tf.int32, [None], name='sequence_length')
+
+    def predict_logits(self, ids, batch_size=1000, out=None, lengths=None):
+        """
+        logits of the two classes of every row of ids. The last batch can be
+        smaller than batch_size: it is run as it is, without padding rows.
+
+        :param ids: ids matrix (also memory-mapped)
+        :param batch_size: number of rows run at a time
+        :param out: optional preallocated float32 array of shape (len(ids), num_classes)
+        :param lengths: number of tokens of every row, needed (and used) only with use_sequence_length
+        :return: the array with the logits
+        """
+        if self.sequence_length is not None and lengths is None:
+            raise ValueError('The LSTM was trained with use_sequence_length: the lengths of the rows are needed')
+        if out is None:
+            out = np.empty((len(ids), self.num_classes), dtype='float32')
+
+        for start in range(0, len(ids), batch_size):
+            batch = np.asarray(ids[start:start+batch_size])
+            if self.sequence_length is None:
+                out[start:start+len(batch)] = self.cache(batch) if self.cache is not None else self._run_batch(batch)
+                continue
+
+            # as in training, an empty row is run over its first token
+            batch_lengths = np.maximum(np.asarray(lengths[start:start+len(batch)]), 1)
+            if self.cache is not None:
+                # the length is part of the row: id 0 is a word, so the same ids can have different lengths
+                out[start:start+len(batch)] = self.cache(np.column_stack([batch, batch_lengths]))
+            else:
+                out[start:start+len(batch)] = self._run_batch(batch, batch_lengths)
+        return out
+
+    def _run_batch(self, batch, lengths=None):
+        feed_dict = {self.input_data: batch}
+        if self.sequence_length is not None:
+            feed_dict[self.sequence_length] = lengths
+        return self.session.run(self.prediction, feed_dict)
+
+    def _run_rows(self, rows):
+        # rows predicted by the cache: with the lengths, the last column of every row is its length
+        if self.sequence_length is None:
+            return self._run_batch(rows)
+        return self._run_batch(rows[:, :-1], rows[:, -1])
+
+    def predict_labels(self, ids, batch_size=1000, lengths=None):
+        """Kaggle labels (1 positive, -1 negative) of every row of ids"""
+        return submission_labels(self.predict_logits(ids, batch_size, lengths=lengths), from_tf=True)
+
+    def close(self):
+        self.session.close()
+
+
+def export_saved_model(word_vectors, checkpoint_dir, export_dir, lstm_units=128, num_classes=2,
+                       use_sequence_length=False):
+    """
+    exports the last checkpoint of the training script as an inference-only
+    SavedModel: the whole graph is in float32 (the training graph runs the
+    LSTM in the precision of the word vectors, float64 for our first
+    checkpoints), there is no dropout and no unused variable, and the word
+    vectors are stored once, as the 'embedding' variable, instead of as a
+    constant in the graph.
+    Load it with LSTMPredictor.from_saved_model.
+
+    :param word_vectors: word vectors matrix used during training
+    :param checkpoint_dir: directory of the checkpoints of the training script
+    :param export_dir: directory of the SavedModel, it must not exist
+    :param use_sequence_length: True if the checkpoint was trained with use_sequence_length: the
+                                SavedModel then takes also the lengths of the rows ('sequence_length')
+    """
+    reader = tf.train.NewCheckpointReader(tf.train.latest_checkpoint(checkpoint_dir))
+
+    graph = tf.Graph()
+    with graph.as_default():
+        word_vectors_init = tf.placeholder(tf.float32, word_vectors.shape)
+        embedding = tf.Variable(word_vectors_init, trainable=False, name='embedding')
+
+        input_data = tf.placeholder(tf.int32, [None, None], name='input_data')
+        inputs = {'input_data': input_data}
+        sequence_length = None
+        if use_sequence_length:
+            sequence_length = tf.placeholder(tf.int32, [None], name='sequence_length')
+            inputs['sequence_length'] = sequence_length
+        prediction, weight, bias = build_lstm_graph(embedding, input_data, lstm_units, num_classes,
+                                                    sequence_length=sequence_length)
+        prediction = tf.identity(prediction, name='prediction')
+
+        with tf.Session(graph=graph) as session:
+            session.run(embedding.initializer, {word_vectors_init: np.asarray(word_vectors, dtype='float32')})
+
+            # the trained values are converted to float32
+            for name, variable in checkpoint_var_list(weight, bias).items():
+                variable.load(reader.get_tensor(name).astype('float32'), session)
+
+            signature = tf.saved_model.signature_def_utils.predict_signature_def(
+                inputs=inputs, outputs={'prediction': prediction})
+
+            builder = tf.saved_model.builder.SavedModelBuilder(export_dir)
+            builder.add_meta_graph_and_variables(
+                session, [tf.saved_model.tag_constants.SERVING],
+                signature_def_map={tf.saved_model.signature_constants.DEFAULT_SERVING_SIGNATURE_DEF_KEY: signature})
+            builder.save()
+
+
+def make_train_dataset(x, y, batch_size, epochs, seed=1, prefetch_batches=16, lengths=None):
+    """
+    tf.data input pipeline for the training loop: the rows of x (also a RowView
+    of a memory-mapped ids matrix) are shuffled at every epoch and grouped in
+    batches of exactly batch_size rows (the last incomplete batch of every
+    epoch is dropped, as in the feed_dict loop). The batches are read by a
+    background thread and prefetched while the optimizer step runs.
+
+    If the lengths of the rows are given, the batches group rows of similar
+    length and are cut to their longest row (see bucket_batch_generator), and
+    the dataset yields also the lengths, for the sequence_length of the LSTM.
+    The number of columns of the batches is then variable.
+
+    :return: the dataset and the number of steps per epoch
+    """
+    steps_per_epoch = len(x) // batch_size
+
+    def batches():
+        random_state = np.random.RandomState(seed)
+        positions = np.arange(len(x))
+        for _ in range(epochs):
+            random_state.shuffle(positions)
+            for step in range(steps_per_epoch):
+                batch = positions[step*batch_size:(step+1)*batch_size]
+                yield np.asarray(x[batch], dtype='int32'), np.asarray(y[batch], dtype='float32')
+
+    def bucketed_batches():
+        generator = bucket_batch_generator(x, y, lengths, batch_size, seed=seed, with_lengths=True)
+        for _ in range(epochs * steps_per_epoch):
+            x_batch, y_batch, batch_lengths = next(generator)
+            yield (np.asarray(x_batch, dtype='int32'), np.asarray(y_batch, dtype='float32'),
+                   batch_lengths.astype('int32'))
+
+    if lengths is None:
+        dataset = tf.data.Dataset.from_generator(batches, (tf.int32, tf.float32),
+                                                 (tf.TensorShape([None, x.shape[1]]),
+                                                  tf.TensorShape([None, y.shape[1]])))
+    else:
+        # the incomplete batches of the buckets are kept, so the steps are counted again
+        steps_per_epoch = len(bucket_batches(np.asarray(lengths), batch_size, shuffle=False))
+        dataset = tf.data.Dataset.from_generator(bucketed_batches, (tf.int32, tf.float32, tf.int32),
+                                                 (tf.TensorShape([None, None]),
+                                                  tf.TensorShape([None, y.shape[1]]),
+                                                  tf.TensorShape([None])))
+    return dataset.prefetch(prefetch_batches), steps_per_epoch